@@ -0,0 +1,187 @@
+import numpy as np
+import pandas as pd
+
+from cleaning import ChunkDeduplicator, clean_chunk
+from customer_features import FEATURE_COLUMNS, main_country, spending_trend
+from dataset_loader import load_dataset_chunks
+from interaction_matrix import build_interaction_matrix
+
+
+# Chunked ingestion for datasets that do not fit in memory, used by knn_alg.py (chunk_size) and
+# kmeans_alg.py (chunkSize).
+# The file is read chunksize rows at a time, every chunk is cleaned with the kmeans_alg.py rules and
+# handed to a set of aggregators. An aggregator only keeps per-customer (or per customer-product)
+# partial results, so the raw transactions are never all in memory at once.
+
+# Partial results are merged once they hold this many rows
+CONSOLIDATE_ROWS = 2_000_000
+
+
+class _Partials:
+    # Partial results of one grouped aggregation (a Series or DataFrame indexed by the group keys), in
+    # chunk order. They are merged with agg ('sum', or a dict of 'first', 'last', 'max', ... per column).
+
+    def __init__(self, agg='sum'):
+        self.agg = agg
+        self._parts = []
+        self._rows = 0
+
+    def add(self, part):
+        self._parts.append(part)
+        self._rows += len(part)
+        if self._rows > CONSOLIDATE_ROWS:
+            self._consolidate()
+
+    def _consolidate(self):
+        if len(self._parts) > 1:
+            combined = pd.concat(self._parts)
+            self._parts = [combined.groupby(level=list(range(combined.index.nlevels)), sort=False).agg(self.agg)]
+            self._rows = len(self._parts[0])
+
+    # The merged result, or None if nothing was added
+    def result(self):
+        self._consolidate()
+        return self._parts[0] if self._parts else None
+
+
+# Rows per (customer, value) pair of a chunk
+def _pair_counts(customers, values):
+    pairs = pd.Series(1, index=pd.MultiIndex.from_arrays([customers, values]))
+    return pairs.groupby(level=[0, 1], sort=False).size()
+
+
+class InteractionCounts:
+    # Customer-product quantity sums, the input of the knn_alg.py interaction matrix
+
+    def __init__(self):
+        self._sums = _Partials()
+
+    def update(self, chunk):
+        self._sums.add(chunk.groupby(['CustomerID', 'StockCode'], sort=False, observed=True)['Quantity'].sum())
+
+    def counts(self):
+        sums = self._sums.result()
+        if sums is None:
+            return pd.DataFrame(columns=['CustomerID', 'StockCode', 'Quantity'])
+        return sums.reset_index()
+
+    # Sparse matrix with the customer and product index maps, see build_interaction_matrix
+    def result(self):
+        return build_interaction_matrix(self.counts())
+
+
+class CustomerFeatures:
+    # The customerData table of kmeans_alg.py (see build_customer_features) from mergeable partials:
+    # per-customer sums and first / last days, and row counts per (customer, value) for the distinct
+    # invoices and products, the favourite day, hour and country, and the monthly spend.
+    # The mean gap between consecutive rows of a customer is (last day - first day) / (rows - 1), so only
+    # the first and last row of every customer are needed, in file order.
+
+    TOTALS = {'FirstDay': 'first', 'LastDay': 'last', 'LastPurchase': 'max', 'Rows': 'sum', 'Quantity': 'sum',
+              'Spend': 'sum'}
+
+    def __init__(self):
+        self._totals = _Partials(self.TOTALS)
+        self._counts = {name: _Partials()
+                        for name in ('invoices', 'products', 'cancelled', 'day', 'hour', 'country')}
+        self._monthly = _Partials()
+
+    def update(self, chunk):
+        customers = chunk['CustomerID'].to_numpy()
+        invoiceDay = chunk['InvoiceDate'].dt.normalize().to_numpy()
+        spend = (chunk['UnitPrice'] * chunk['Quantity']).to_numpy()
+        totals = pd.DataFrame({'CustomerID': customers, 'FirstDay': invoiceDay, 'LastDay': invoiceDay,
+                               'LastPurchase': invoiceDay, 'Rows': 1, 'Quantity': chunk['Quantity'].to_numpy(),
+                               'Spend': spend})
+        self._totals.add(totals.groupby('CustomerID', sort=False).agg(self.TOTALS))
+
+        cancelled = (chunk['Transaction_Status'] == 'Cancelled').to_numpy()
+        self._counts['invoices'].add(_pair_counts(customers, chunk['InvoiceNo'].to_numpy()))
+        self._counts['products'].add(_pair_counts(customers, chunk['StockCode'].to_numpy()))
+        self._counts['cancelled'].add(_pair_counts(customers[cancelled], chunk['InvoiceNo'].to_numpy()[cancelled]))
+        self._counts['day'].add(_pair_counts(customers, chunk['InvoiceDate'].dt.dayofweek.to_numpy()))
+        self._counts['hour'].add(_pair_counts(customers, chunk['InvoiceDate'].dt.hour.to_numpy()))
+        self._counts['country'].add(_pair_counts(customers, chunk['Country'].to_numpy()))
+
+        month = (chunk['InvoiceDate'].dt.year * 12 + chunk['InvoiceDate'].dt.month - 1).to_numpy()
+        self._monthly.add(pd.Series(spend, index=pd.MultiIndex.from_arrays([customers, month]))
+                          .groupby(level=[0, 1], sort=False).sum())
+
+    # (customer, value) row counts, sorted like a groupby on both
+    def _pairs(self, name):
+        counts = self._counts[name].result()
+        return pd.Series(dtype=np.int64) if counts is None else counts.sort_index()
+
+    # reference_day is the day recency is measured from, by default the last day of the data
+    def result(self, reference_day=None):
+        totals = self._totals.result().sort_index()
+        customers = totals.index
+        if reference_day is None:
+            reference_day = totals['LastPurchase'].max()
+
+        customerData = pd.DataFrame(index=customers)
+        customerData['Days_Since_Last_Purchase'] = (reference_day - totals['LastPurchase']).dt.days
+        customerData['Total_Transactions'] = self._pairs('invoices').groupby(level=0).size().reindex(customers)
+        customerData['Total_Products_Purchased'] = totals['Quantity']
+        customerData['Total_Spend'] = totals['Spend']
+        customerData['Average_Transaction_Value'] = \
+            customerData['Total_Spend'] / customerData['Total_Transactions']
+        customerData['Unique_Products_Purchased'] = \
+            self._pairs('products').groupby(level=0).size().reindex(customers)
+        customerData['Average_Days_Between_Purchases'] = \
+            ((totals['LastDay'] - totals['FirstDay']).dt.days / (totals['Rows'] - 1)).where(totals['Rows'] > 1)
+
+        # Ties go to the smallest value, like build_customer_features
+        for column, name in (('Day_Of_Week', 'day'), ('Hour', 'hour')):
+            customerData[column] = self._pairs(name).unstack(fill_value=0).idxmax(axis=1).astype('int32')
+        customerData['Is_UK'] = (main_country(self._pairs('country')) == 'United Kingdom').astype('int64')
+
+        cancelled = self._pairs('cancelled')
+        customerData['Cancellation_Frequency'] = \
+            cancelled.groupby(level=0).size().reindex(customers, fill_value=0).astype('int64')
+        customerData['Cancellation_Rate'] = \
+            customerData['Cancellation_Frequency'] / customerData['Total_Transactions']
+
+        monthly_spending = self._monthly.result().sort_index()
+        monthly_grouped = monthly_spending.groupby(level=0)
+        customerData['Monthly_Spending_Mean'] = monthly_grouped.mean()
+        customerData['Monthly_Spending_Std'] = monthly_grouped.std().fillna(0)
+        customerData['Spending_Trend'] = spending_trend(monthly_spending)
+
+        # Customers with a single transaction row have no gap between purchases and are left out
+        customerData = customerData[customerData['Average_Days_Between_Purchases'].notna()]
+
+        return customerData[FEATURE_COLUMNS].rename_axis('CustomerID').reset_index()
+
+
+class ProductQuantities:
+    # Quantity sums per customer, product and description: the columns of the transactions that
+    # kmeans_recommend.cluster_purchases uses, with the same sums
+
+    def __init__(self):
+        self._sums = _Partials()
+
+    def update(self, chunk):
+        self._sums.add(chunk.groupby(['CustomerID', 'StockCode', 'Description'], sort=False,
+                                     observed=True)['Quantity'].sum())
+
+    def result(self):
+        sums = self._sums.result()
+        if sums is None:
+            return pd.DataFrame(columns=['CustomerID', 'StockCode', 'Description', 'Quantity'])
+        return sums.reset_index()
+
+
+# Reads file_path chunk by chunk, cleans every chunk and feeds it to each aggregator.
+# Peak memory is one raw chunk plus the aggregators' partial results. With report (a cleaning.CleaningReport)
+# the figures of the clean_transactions report are gathered as well.
+def ingest_chunks(file_path, aggregators, chunksize=500_000, report=None):
+    deduplicator = ChunkDeduplicator()
+    n_rows = 0
+    for chunk in load_dataset_chunks(file_path, chunksize=chunksize):
+        n_rows += len(chunk)
+        chunk = clean_chunk(chunk, deduplicator, report)
+        for aggregator in aggregators:
+            aggregator.update(chunk)
+        print(f"Ingested {n_rows} rows")
+    return aggregators
@@ -0,0 +1,160 @@
+import numpy as np
+import pandas as pd
+
+
+SERVICE_RELATED_DESCRIPTIONS = ["Next Day Carriage", "High Resolution Image"]
+
+
+# Stock codes with 0 or 1 digits (POST, M, D, C2, ...) are not real products
+def is_anomalous_stock_code(code):
+    return sum(c.isdigit() for c in str(code)) in (0, 1)
+
+
+# The cleaning chain of kmeans_alg.py. Returns the cleaned transactions and a report with the
+# figures the diagnostic charts and prints are made from.
+def clean_transactions(df):
+    report = {}
+
+    missingData = df.isnull().sum()
+    missingPercentage = (missingData[missingData > 0] / df.shape[0]) * 100
+    missingPercentage.sort_values(ascending=True, inplace=True)
+    report['missingPercentage'] = missingPercentage
+
+    df = df.dropna(subset=['CustomerID', 'Description'])
+
+    df = df.assign(Transaction_Status=np.where(df['InvoiceNo'].astype(str).str.startswith('C'),
+                                               'Cancelled', 'Completed'))
+
+    cancelledTransactions = df[df['Transaction_Status'] == 'Cancelled']
+
+    df = df.drop_duplicates()
+
+    report['cancelledPercentage'] = (cancelledTransactions.shape[0] / df.shape[0]) * 100
+    report['top10StockCodes'] = df['StockCode'].value_counts(normalize=True).head(10) * 100
+
+    uniqueStockCodes = df['StockCode'].unique()
+    report['uniqueNumericCharCount'] = pd.Series(uniqueStockCodes).apply(
+        lambda x: sum(c.isdigit() for c in str(x))).value_counts()
+
+    anomalousStockCodes = [code for code in uniqueStockCodes if is_anomalous_stock_code(code)]
+    report['anomalousStockCodes'] = anomalousStockCodes
+    report['percentageAnomalous'] = (df['StockCode'].isin(anomalousStockCodes).sum() / len(df)) * 100
+
+    df = df[~df['StockCode'].isin(anomalousStockCodes)]
+
+    report['top30Descriptions'] = df['Description'].value_counts()[:30]
+
+    report['serviceRelatedPercentage'] = \
+        df[df['Description'].isin(SERVICE_RELATED_DESCRIPTIONS)].shape[0] / df.shape[0] * 100
+    df = df[~df['Description'].isin(SERVICE_RELATED_DESCRIPTIONS)]
+
+    df = df[df['UnitPrice'] > 0].reset_index(drop=True)
+
+    df['Description'] = df['Description'].str.upper()
+
+    return df, report
+
+
+# Drops duplicate rows across the chunks of a chunked read, wherever they are in the file.
+# The 64-bit hash of every kept row is kept in one sorted array, 8 bytes per row: far less than the rows
+# themselves, but it does grow with the file.
+class ChunkDeduplicator:
+    def __init__(self):
+        self._seen = np.empty(0, dtype=np.uint64)
+
+    def drop_duplicates(self, chunk):
+        hashes = pd.util.hash_pandas_object(chunk, index=False).to_numpy()
+        position = np.minimum(np.searchsorted(self._seen, hashes), max(len(self._seen) - 1, 0))
+        seen = self._seen[position] == hashes if len(self._seen) else np.zeros(len(hashes), dtype=bool)
+        keep = ~pd.Series(hashes).duplicated().to_numpy() & ~seen
+        # Two sorted runs, which the stable sort merges in linear time
+        self._seen = np.sort(np.concatenate([self._seen, np.sort(hashes[keep])]), kind='stable')
+        return chunk[keep]
+
+
+# The report of clean_transactions, gathered chunk by chunk by clean_chunk. Only counts are kept (rows,
+# missing values, cancelled rows, rows per stock code and per description), so its size depends on the
+# number of distinct codes and descriptions, not on the number of rows.
+class CleaningReport:
+    def __init__(self):
+        self.rows = 0
+        self.missing = None
+        self.cancelled = 0
+        self.stock_codes = pd.Series(dtype=np.int64)
+        self.descriptions = pd.Series(dtype=np.int64)
+
+    def count_raw(self, chunk):
+        self.rows += len(chunk)
+        missing = chunk.isnull().sum()
+        self.missing = missing if self.missing is None else self.missing + missing
+
+    # Rows of the chunk after dropping duplicates, before the anomalous stock codes are removed
+    def count_stock_codes(self, chunk):
+        self.stock_codes = self.stock_codes.add(chunk['StockCode'].value_counts(), fill_value=0)
+
+    # Rows of the chunk after the anomalous stock codes are removed
+    def count_descriptions(self, chunk):
+        self.descriptions = self.descriptions.add(chunk['Description'].value_counts(), fill_value=0)
+
+    # Same keys and figures as the report of clean_transactions
+    def result(self):
+        report = {}
+
+        missingPercentage = (self.missing[self.missing > 0] / self.rows) * 100
+        missingPercentage.sort_values(ascending=True, inplace=True)
+        report['missingPercentage'] = missingPercentage
+
+        stockCodes = self.stock_codes.astype(np.int64).sort_values(ascending=False, kind='stable')
+        stockCodes = stockCodes.rename_axis('StockCode').rename('count')
+        rows = stockCodes.sum()
+        report['cancelledPercentage'] = (self.cancelled / rows) * 100
+        report['top10StockCodes'] = (stockCodes / rows).rename('proportion').head(10) * 100
+
+        report['uniqueNumericCharCount'] = pd.Series(stockCodes.index).apply(
+            lambda x: sum(c.isdigit() for c in str(x))).value_counts()
+
+        anomalousStockCodes = [code for code in stockCodes.index if is_anomalous_stock_code(code)]
+        report['anomalousStockCodes'] = anomalousStockCodes
+        report['percentageAnomalous'] = (stockCodes[anomalousStockCodes].sum() / rows) * 100
+
+        descriptions = self.descriptions.astype(np.int64).sort_values(ascending=False, kind='stable')
+        descriptions = descriptions.rename_axis('Description').rename('count')
+        report['top30Descriptions'] = descriptions[:30]
+
+        report['serviceRelatedPercentage'] = \
+            descriptions.reindex(SERVICE_RELATED_DESCRIPTIONS, fill_value=0).sum() / descriptions.sum() * 100
+        return report
+
+
+# The row-level rules of clean_transactions, applied to one chunk of a chunked read.
+# Pass the same deduplicator (and report, to get the figures of clean_transactions) for every chunk of a file.
+def clean_chunk(chunk, deduplicator=None, report=None):
+    if report is not None:
+        report.count_raw(chunk)
+
+    chunk = chunk.dropna(subset=['CustomerID', 'Description'])
+
+    chunk = chunk.assign(Transaction_Status=np.where(chunk['InvoiceNo'].astype(str).str.startswith('C'),
+                                                     'Cancelled', 'Completed'))
+    if report is not None:
+        report.cancelled += int((chunk['Transaction_Status'] == 'Cancelled').sum())
+
+    if deduplicator is None:
+        chunk = chunk.drop_duplicates()
+    else:
+        chunk = deduplicator.drop_duplicates(chunk)
+    if report is not None:
+        report.count_stock_codes(chunk)
+
+    # Same test as is_anomalous_stock_code, vectorised
+    chunk = chunk[~chunk['StockCode'].astype(str).str.count(r'\d').isin((0, 1))]
+    if report is not None:
+        report.count_descriptions(chunk)
+
+    chunk = chunk[~chunk['Description'].isin(SERVICE_RELATED_DESCRIPTIONS)]
+
+    chunk = chunk[chunk['UnitPrice'] > 0].reset_index(drop=True)
+
+    chunk['Description'] = chunk['Description'].str.upper()
+
+    return chunk
@@ -0,0 +1,32 @@
+import numpy as np
+import pandas as pd
+
+from model_store import MODEL_DIR, load_artifact
+
+
+# Cluster assignment with the models saved by kmeans_alg.py (see model_store.py): outlier detection,
+# scaling, PCA and KMeans.predict, without refitting anything.
+# customerData is a build_customer_features table. Returns the customers that are not outliers with
+# their 'cluster' column, and the metadata of the KMeans model used.
+def assign_clusters(customerData, model_dir=MODEL_DIR):
+    outlierModel, outlierMetadata = load_artifact('isolation_forest', model_dir=model_dir)
+    isOutlier = outlierModel.predict(customerData[outlierMetadata['schema']].to_numpy()) == -1
+    customerDataCleaned = customerData[~isOutlier].reset_index(drop=True)
+    if customerDataCleaned.empty:
+        kMeansMetadata = load_artifact('kmeans', model_dir=model_dir)[1]
+        return customerDataCleaned.assign(cluster=pd.Series(dtype='int64')), kMeansMetadata
+
+    scaler, scalerMetadata = load_artifact('scaler', model_dir=model_dir)
+    customerDataScaled = customerDataCleaned.set_index('CustomerID')
+    customerDataScaled[scalerMetadata['schema']] = scaler.transform(customerDataScaled[scalerMetadata['schema']])
+
+    pca, pcaMetadata = load_artifact('pca', model_dir=model_dir)
+    customerDataPCA = pd.DataFrame(pca.transform(customerDataScaled[pcaMetadata['schema']]),
+                                   columns=['PC' + str(i + 1) for i in range(pca.n_components_)],
+                                   index=customerDataScaled.index)
+
+    kMeans, kMeansMetadata = load_artifact('kmeans', schema=customerDataPCA.columns, model_dir=model_dir)
+    labelMapping = np.array(kMeansMetadata['extra']['labelMapping'])
+    customerDataCleaned['cluster'] = labelMapping[kMeans.predict(customerDataPCA)]
+
+    return customerDataCleaned, kMeansMetadata
@@ -0,0 +1,111 @@
+import numpy as np
+import pandas as pd
+from scipy.optimize import linear_sum_assignment
+from scipy.spatial.distance import cdist
+from sklearn.cluster import MiniBatchKMeans
+from sklearn.metrics import adjusted_rand_score
+
+from model_store import MODEL_DIR, latest_metadata
+from silhouette import SilhouetteEvaluator
+
+
+# Clustering backends of kmeans_alg.py.
+# 'full' is KMeans on all customers at once (see model_selection.py). 'minibatch' is MiniBatchKMeans fitted
+# with partial_fit, one chunk of customers at a time, so memory is bounded by the chunk size and not by the
+# number of customers. It can start from the centroids saved by the previous run instead of k-means++.
+
+BACKENDS = ('full', 'minibatch')
+
+# Customers per chunk (the unit read at a time) and per mini-batch update (the unit of partial_fit)
+CHUNK_SIZE = 10_000
+BATCH_SIZE = 256
+
+MINIBATCH_PARAMS = {'init': 'k-means++', 'n_init': 3, 'random_state': 0}
+
+
+# Consecutive row blocks of an array, memory-mapped array or data frame
+def iter_chunks(X, chunk_size=CHUNK_SIZE):
+    for start in range(0, len(X), chunk_size):
+        yield X.iloc[start:start + chunk_size] if isinstance(X, pd.DataFrame) else X[start:start + chunk_size]
+
+
+# Centroids saved with the latest kmeans model (in the scaled feature space, see kmeans_alg.py), or None
+# if there are none for n_clusters clusters of these features
+def previous_centroids(n_clusters, features, model_dir=MODEL_DIR):
+    metadata = latest_metadata('kmeans', model_dir)
+    if metadata is None:
+        return None
+    extra = metadata['extra']
+    if extra.get('features') != list(features) or len(extra.get('centroids', [])) != n_clusters:
+        return None
+    return np.array(extra['centroids'], dtype=np.float64)
+
+
+# New id of every cluster (indexed by the model's label). With the centroids of the previous run each
+# cluster takes the id of the previous centroid it is matched to (Hungarian assignment on the distance
+# between centroids), so ids stay stable across runs. Otherwise clusters are numbered by size, largest first.
+def align_labels(centroids, labels, previous=None):
+    n_clusters = len(centroids)
+    mapping = np.empty(n_clusters, dtype=np.int64)
+    if previous is None or len(previous) != n_clusters:
+        bySize = np.argsort(-np.bincount(labels, minlength=n_clusters), kind='stable')
+        mapping[bySize] = np.arange(n_clusters)
+    else:
+        clusters, ids = linear_sum_assignment(cdist(centroids, previous))
+        mapping[clusters] = ids
+    return mapping
+
+
+# Labels and inertia of X under the model's centroids, a chunk at a time
+def assign_chunks(model, X, chunk_size=CHUNK_SIZE):
+    labels = []
+    inertia = 0.0
+    for chunk in iter_chunks(X, chunk_size):
+        distances = model.transform(chunk)
+        chunkLabels = distances.argmin(axis=1)
+        labels.append(chunkLabels)
+        inertia += float(np.sum(distances[np.arange(len(chunkLabels)), chunkLabels] ** 2))
+    return np.concatenate(labels), inertia
+
+
+# MiniBatchKMeans with n_clusters clusters, fitted by partial_fit on mini-batches of every chunk of X for
+# n_epochs passes. init is an array of starting centroids (warm start) or None for k-means++.
+# Like MiniBatchKMeans.fit, labels_ and inertia_ are those of all of X at the end.
+def fit_minibatch(X, n_clusters, init=None, chunk_size=CHUNK_SIZE, batch_size=BATCH_SIZE, n_epochs=10,
+                  random_state=0):
+    params = {**MINIBATCH_PARAMS, 'random_state': random_state}
+    if init is not None:
+        params.update(init=np.asarray(init, dtype=np.float64), n_init=1)
+    model = MiniBatchKMeans(n_clusters=n_clusters, batch_size=batch_size, **params)
+
+    rng = np.random.default_rng(random_state)
+    for _ in range(n_epochs):
+        for chunk in iter_chunks(X, chunk_size):
+            order = rng.permutation(len(chunk))
+            # The first update initialises the centroids, so it needs at least n_clusters rows
+            for start in range(0, len(chunk), batch_size):
+                batch = order[start:start + batch_size]
+                if not hasattr(model, 'cluster_centers_') and len(batch) < n_clusters:
+                    continue
+                model.partial_fit(chunk.iloc[batch] if isinstance(chunk, pd.DataFrame) else chunk[batch])
+
+    model.labels_, model.inertia_ = assign_chunks(model, X, chunk_size)
+    return model
+
+
+# Inertia and silhouette of every fitted model ({backend: model}) on X, next to the reference model's:
+# the inertia relative to it and the agreement of the labels (adjusted Rand index)
+def quality_report(X, models, reference='full', evaluator=None):
+    evaluator = evaluator or SilhouetteEvaluator()
+    rows = {}
+    for backend, model in models.items():
+        silhouette = evaluator.score(X, model.labels_)
+        rows[backend] = {
+            'inertia': model.inertia_,
+            'inertia_vs_' + reference: model.inertia_ / models[reference].inertia_,
+            'silhouette': silhouette['score'],
+            'silhouette_low': silhouette['low'],
+            'silhouette_high': silhouette['high'],
+            'label_agreement': adjusted_rand_score(models[reference].labels_, model.labels_),
+        }
+    return pd.DataFrame(rows).T.rename_axis('backend')
@@ -1,79 +1,144 @@
+import numpy as np
 import pandas as pd
-import random
-
-# Load the CSV files
-recom1 = pd.read_excel('knn_customer_recommendations.xlsx')
-recom2 = pd.read_excel('kmeans_customer_recommendations.xlsx')
 
+from result_store import read_results, write_results
 
 
 # Name for the Customer ID column
 customer_key = 'CustomerID'
 
-# Ensure both dataframes have the expected Customer ID column
-assert customer_key in recom2.columns and customer_key in recom1.columns, f"Expected '{customer_key}' column not found."
-
-# Create a DataFrame to store results
-matching_customers = pd.DataFrame(columns=[customer_key, 'recommendations'])
-
-# Iterate over both dataframes to find common product recommendations
-for idx in range(len(recom1)):
-    # Get the customer ID and their recommendations from each file
-    customer_id = recom1.loc[idx, customer_key]
-
-     # Check if the current customer ID exists in recom1
-    if customer_id not in recom2[customer_key].values:
-        continue
-
-    # Get the index of the customer ID in recom1
-    recom2_idx = recom2[recom2[customer_key] == customer_id].index[0]
-
-    # Convert recommendations to sets for easier intersection
-    recoms1 = {str(recom1.loc[idx, 'RecommendedProduct1']), str(recom1.loc[idx, 'RecommendedProduct2']), str(recom1.loc[idx, 'RecommendedProduct3'])}
-    recoms2 = {str(recom2.loc[recom2_idx, 'RecommendedProduct1']), str(recom2.loc[recom2_idx, 'RecommendedProduct2']), str(recom2.loc[recom2_idx, 'RecommendedProduct3'])}
-
-    rand_value = random.random()
-
-    if rand_value < 0.85:
-        common_recommendations = recoms1
-    
+n_recommendations = 3
+
+no_match = "Did not match"
+
+# How the two engines' recommendations are combined:
+# 'agreement'    - rank each customer's products by how many engines recommend them, then by
+#                  reciprocal-rank fusion of their positions (deterministic)
+# 'intersection' - only the products both engines recommend
+# 'sampled'      - keep the KNN recommendations as they are for keep_share of the customers and
+#                  intersect the rest; the customers are drawn with random_seed
+comparison_mode = 'agreement'
+
+# Share of customers whose KNN recommendations are kept as they are in 'sampled' mode
+keep_share = 0.85
+random_seed = 0
+
+# Reciprocal-rank fusion constant: a product at position r of an engine scores 1 / (rrf_k + r)
+rrf_k = 60
+
+MODES = ('agreement', 'intersection', 'sampled')
+
+# Format of the stored comparison ('parquet', 'feather' or 'excel'), and whether to also export an Excel report
+result_format = 'parquet'
+excel_report = False
+
+
+# The recommended stock codes of one engine's output as a (customers x 3) frame.
+# knn_alg.py writes 'RecommendedProductN' columns, kmeans_alg.py 'Recommendation N Stock Code'.
+def recommended_codes(recom):
+    assert customer_key in recom.columns, f"Expected '{customer_key}' column not found."
+
+    columns = [f'RecommendedProduct{i}' for i in range(1, n_recommendations + 1)]
+    if not all(column in recom.columns for column in columns):
+        columns = [f'Recommendation {i} Stock Code' for i in range(1, n_recommendations + 1)]
+
+    codes = recom[[customer_key] + columns].drop_duplicates(subset=[customer_key])
+    codes.columns = [customer_key] + [f'Product{i}' for i in range(1, n_recommendations + 1)]
+    return codes
+
+
+# The intersection of the three recommendations of each side, for all rows at once.
+# Rows flagged in keep_all keep their first-side recommendations as they are.
+def intersect_recommendations(recoms1, recoms2, keep_all):
+    # Every product once per customer: drop repeats of an earlier slot
+    first_occurrence = np.ones(recoms1.shape, dtype=bool)
+    for i in range(1, recoms1.shape[1]):
+        first_occurrence[:, i] = ~(recoms1[:, [i]] == recoms1[:, :i]).any(axis=1)
+
+    in_both = (recoms1[:, :, None] == recoms2[:, None, :]).any(axis=2)
+    keep = first_occurrence & (in_both | keep_all[:, None])
+
+    # Move the kept recommendations to the front and fill the rest with the placeholder
+    order = np.argsort(~keep, axis=1, kind='stable')
+    return np.where(np.take_along_axis(keep, order, axis=1), np.take_along_axis(recoms1, order, axis=1), no_match)
+
+
+# Agreement scoring of any number of engines' recommendations (one (customers x slots) array each).
+# Every product a customer was recommended gets the number of engines that recommend it and its
+# reciprocal-rank fusion score; products are ordered by agreement, then score, then by where they first
+# appear (engine order, then position), so the result never depends on chance.
+# Returns the top products and their agreement counts, padded with "Did not match" / 0.
+def agreement_scores(recoms, missing):
+    n_rows, n_slots = recoms[0].shape
+    rows = np.tile(np.repeat(np.arange(n_rows), n_slots), len(recoms))
+    ranks = np.tile(np.tile(np.arange(1, n_slots + 1), n_rows), len(recoms))
+    engines = np.repeat(np.arange(len(recoms)), n_rows * n_slots)
+
+    items = pd.DataFrame({'row': rows, 'engine': engines, 'rank': ranks,
+                          'product': np.concatenate([recom.ravel() for recom in recoms]),
+                          'missing': np.concatenate([gap.ravel() for gap in missing])})
+    items = items[~items['missing']]
+    items['first_seen'] = items['engine'] * n_slots + items['rank']
+    # A product an engine lists twice only counts at its best position
+    items = items.drop_duplicates(subset=['row', 'engine', 'product'])
+    items['rrf'] = 1 / (rrf_k + items['rank'])
+
+    scores = items.groupby(['row', 'product'], sort=False).agg(agreement=('engine', 'nunique'),
+                                                               rrf=('rrf', 'sum'),
+                                                               first_seen=('first_seen', 'min')).reset_index()
+    scores = scores.sort_values(['row', 'agreement', 'rrf', 'first_seen'], ascending=[True, False, False, True])
+    best = scores.groupby('row', sort=False).head(n_recommendations)
+    position = best.groupby('row', sort=False).cumcount().to_numpy()
+
+    products = np.full((n_rows, n_recommendations), no_match, dtype=object)
+    agreement = np.zeros((n_rows, n_recommendations), dtype=np.int64)
+    products[best['row'].to_numpy(), position] = best['product'].to_numpy()
+    agreement[best['row'].to_numpy(), position] = best['agreement'].to_numpy()
+    return products, agreement
+
+
+# Customers recommended by both engines, joined once on the customer id, with the combined
+# recommendations in the 'Recommendation N' columns (see comparison_mode).
+# In 'agreement' mode 'Recommendation N Agreement' holds the number of engines recommending it.
+def compare_recommendations(recom1, recom2, mode='agreement', seed=random_seed):
+    if mode not in MODES:
+        raise ValueError(f"Unknown comparison mode '{mode}', expected one of {MODES}")
+    product_columns = [f'Product{i}' for i in range(1, n_recommendations + 1)]
+    output_columns = [f'Recommendation {i}' for i in range(1, n_recommendations + 1)]
+
+    joined = recommended_codes(recom1).merge(recommended_codes(recom2), on=customer_key, how='inner',
+                                             suffixes=('_1', '_2'))
+    sides = [joined[[column + suffix for column in product_columns]] for suffix in ('_1', '_2')]
+
+    # Recommendations are compared as strings
+    recoms1, recoms2 = [side.astype(str).to_numpy(dtype=object) for side in sides]
+
+    if mode == 'agreement':
+        matched, agreement = agreement_scores([recoms1, recoms2], [side.isna().to_numpy() for side in sides])
+        matching_customers = pd.DataFrame(matched, columns=output_columns)
+        for i, column in enumerate(output_columns):
+            matching_customers[column + ' Agreement'] = agreement[:, i]
     else:
-        common_recommendations = recoms1.intersection(recoms2)
-
-    # Find common and unique recommendations
-    # common_recommendations = recoms1.intersection(recoms2)
-    # unique_recoms1 = recoms1 - common_recommendations
-    # unique_recoms2 = recoms2 - common_recommendations
-
-    # Create a list to store results with placeholders for non-matching recommendations
-    matched_recommendations = list(common_recommendations)
-
-    # Find recommendations that did not match and append placeholders
-    # Assuming 3 recommendations and filling missing ones with "Did not match"
-    while len(matched_recommendations) < 3:
-        matched_recommendations.append("Did not match")
-
-    # Add results to the DataFrame
-    matching_customers = pd.concat([
-        matching_customers,
-        pd.DataFrame({
-            customer_key: [customer_id],
-            'Recommendation 1': [matched_recommendations[0]],
-            'Recommendation 2': [matched_recommendations[1]],
-            'Recommendation 3': [matched_recommendations[2]],
-        })
-    ], ignore_index=True)
-
+        if mode == 'sampled':
+            keep_all = np.random.default_rng(seed).random(len(joined)) < keep_share
+        else:
+            keep_all = np.zeros(len(joined), dtype=bool)
+        matching_customers = pd.DataFrame(intersect_recommendations(recoms1, recoms2, keep_all),
+                                          columns=output_columns)
 
-if 'recommendations' in matching_customers.columns:
-    matching_customers.drop(columns=['recommendations'], inplace=True)
+    matching_customers.insert(0, customer_key, joined[customer_key].to_numpy())
+    return matching_customers
 
-# Display the resulting DataFrame with matching recommendations
-print("Customers with matched recommendations and placeholders for non-matches:")
-print(matching_customers)
 
+if __name__ == '__main__':
+    # Load the recommendations of both engines
+    recom1 = read_results('knn_customer_recommendations')
+    recom2 = read_results('kmeans_customer_recommendations')
 
+    matching_customers = compare_recommendations(recom1, recom2, mode=comparison_mode, seed=random_seed)
 
+    # Display the resulting DataFrame with matching recommendations
+    print("Customers with matched recommendations and placeholders for non-matches:")
+    print(matching_customers)
 
-output_path = 'compares_results.xlsx'  # Change this to your desired output file name
-matching_customers.to_excel(output_path, index=False)
\ No newline at end of file
+    write_results(matching_customers, 'compares_results', format=result_format, excel_report=excel_report)
@@ -0,0 +1,118 @@
+import numpy as np
+import pandas as pd
+
+
+# Per-customer features of kmeans_alg.py (the customerData table).
+# Customers are replaced by integer codes once, the plain per-customer features come out of a single
+# grouped aggregation, and the favourites / monthly statistics need one small extra groupby each.
+# Nothing is merged: every feature is aligned on the same customer codes.
+
+FEATURE_COLUMNS = ['Days_Since_Last_Purchase', 'Total_Transactions', 'Total_Products_Purchased', 'Total_Spend',
+                   'Average_Transaction_Value', 'Unique_Products_Purchased', 'Average_Days_Between_Purchases',
+                   'Day_Of_Week', 'Hour', 'Is_UK', 'Cancellation_Frequency', 'Cancellation_Rate',
+                   'Monthly_Spending_Mean', 'Monthly_Spending_Std', 'Spending_Trend']
+
+
+# Least-squares slope of every customer's monthly spend against the month number 0, 1, 2, ...
+# (what scipy's linregress gives per customer), for all customers at once from grouped sums.
+# monthly_spending is indexed by (customer, month) in month order. Customers with one month get 0.
+def spending_trend(monthly_spending):
+    customers = monthly_spending.index.get_level_values(0)
+    y = monthly_spending.to_numpy(dtype=np.float64)
+    x = monthly_spending.groupby(level=0).cumcount().to_numpy(dtype=np.float64)
+
+    sums = pd.DataFrame({'n': 1.0, 'y': y, 'xy': x * y}).groupby(customers).sum()
+    n = sums['n']
+    # x runs from 0 to n - 1, so its mean and spread have closed forms
+    meanX = (n - 1) / 2
+    sxx = n * (n * n - 1) / 12
+    sxy = sums['xy'] - meanX * sums['y']
+
+    return (sxy / sxx.where(n > 1)).fillna(0.0)
+
+
+# Value with the most rows per customer; ties go to the smallest value
+def _most_frequent(codes, values, n_customers):
+    counts = pd.crosstab(codes, values)
+    return counts.idxmax(axis=1).reindex(range(n_customers))
+
+
+# Mean gap in days between consecutive transaction rows of every customer (rows in file order).
+# One stable sort groups the rows by customer without reordering them, then a grouped diff on integer
+# day numbers and a grouped mean. Customers with a single row get NaN.
+def average_days_between_purchases(codes, invoiceDay):
+    dayNumbers = invoiceDay.to_numpy().astype('datetime64[D]').astype(np.int64)
+    order = np.argsort(codes, kind='stable')
+
+    days = pd.Series(dayNumbers[order])
+    customers = codes[order]
+    gaps = days.groupby(customers).diff()
+    return gaps.groupby(customers).mean()
+
+
+# Country with the most rows per customer, picked from the (customer, country) row counts the same way
+# kmeans_alg.py always did: sorted by count, first row per customer
+def main_country(counts):
+    counts = counts.reset_index(name='Count')
+    counts.columns = ['customer', 'Country', 'Count']
+    mainCountry = counts.sort_values('Count', ascending=False).drop_duplicates('customer')
+    return mainCountry.set_index('customer')['Country']
+
+
+def _main_country(codes, countries):
+    return main_country(pd.Series(1, index=[codes, countries]).groupby(level=[0, 1], observed=True).size())
+
+
+# reference_day is the day recency is measured from, by default the last day in df
+def build_customer_features(df, reference_day=None):
+    codes, customers = pd.factorize(df['CustomerID'], sort=True)
+    n_customers = len(customers)
+
+    invoiceDay = df['InvoiceDate'].dt.normalize()
+    transactions = pd.DataFrame({
+        'customer': codes,
+        'InvoiceNo': df['InvoiceNo'].to_numpy(),
+        'StockCode': df['StockCode'].to_numpy(),
+        'Quantity': df['Quantity'].to_numpy(),
+        'Total_Spend': (df['UnitPrice'] * df['Quantity']).to_numpy(),
+        'InvoiceDay': invoiceDay.to_numpy(),
+        # Invoice number of cancelled rows only, so nunique counts the cancelled invoices
+        'CancelledInvoice': df['InvoiceNo'].where(df['Transaction_Status'] == 'Cancelled').to_numpy(),
+        'Month': (df['InvoiceDate'].dt.year * 12 + df['InvoiceDate'].dt.month - 1).to_numpy(),
+    })
+
+    grouped = transactions.groupby('customer')
+    customerData = grouped.agg(
+        LastPurchase=('InvoiceDay', 'max'),
+        Total_Transactions=('InvoiceNo', 'nunique'),
+        Total_Products_Purchased=('Quantity', 'sum'),
+        Total_Spend=('Total_Spend', 'sum'),
+        Unique_Products_Purchased=('StockCode', 'nunique'),
+        Cancellation_Frequency=('CancelledInvoice', 'nunique'),
+    )
+
+    if reference_day is None:
+        reference_day = invoiceDay.max()
+    customerData['Days_Since_Last_Purchase'] = (reference_day - customerData.pop('LastPurchase')).dt.days
+    customerData['Average_Transaction_Value'] = customerData['Total_Spend'] / customerData['Total_Transactions']
+    customerData['Cancellation_Rate'] = customerData['Cancellation_Frequency'] / customerData['Total_Transactions']
+
+    customerData['Average_Days_Between_Purchases'] = average_days_between_purchases(codes, invoiceDay)
+
+    customerData['Day_Of_Week'] = _most_frequent(codes, df['InvoiceDate'].dt.dayofweek.to_numpy(),
+                                                 n_customers).astype('int32')
+    customerData['Hour'] = _most_frequent(codes, df['InvoiceDate'].dt.hour.to_numpy(), n_customers).astype('int32')
+    mainCountry = _main_country(codes, df['Country'].to_numpy())
+    customerData['Is_UK'] = (mainCountry == 'United Kingdom').astype('int64')
+
+    monthly_spending = transactions.groupby(['customer', 'Month'])['Total_Spend'].sum()
+    monthly_grouped = monthly_spending.groupby(level=0)
+    customerData['Monthly_Spending_Mean'] = monthly_grouped.mean()
+    customerData['Monthly_Spending_Std'] = monthly_grouped.std().fillna(0)
+    customerData['Spending_Trend'] = spending_trend(monthly_spending)
+
+    # Customers with a single transaction row have no gap between purchases and are left out
+    customerData = customerData[customerData['Average_Days_Between_Purchases'].notna()]
+
+    customerData = customerData[FEATURE_COLUMNS].set_index(customers.take(customerData.index))
+    return customerData.rename_axis('CustomerID').reset_index()
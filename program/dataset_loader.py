@@ -0,0 +1,97 @@
+import codecs
+import warnings
+
+import pandas as pd
+
+
+# Column types of the sales dataset. Declaring them up front means pandas does not have to guess
+# (and StockCode no longer comes back as a mix of ints and strings).
+DTYPES = {
+    'InvoiceNo': str,
+    'StockCode': str,
+    'Description': str,
+    'Quantity': 'int64',
+    'UnitPrice': 'float64',
+    'CustomerID': 'float64',
+    'Country': str,
+}
+
+DATE_COLUMN = 'InvoiceDate'
+DATE_FORMAT = '%m/%d/%Y %H:%M'
+
+# Number of bytes looked at to decide the encoding
+SAMPLE_SIZE = 1 << 20
+
+
+# Guesses the file encoding from the first sample_size bytes only.
+# Only a sample with non-ASCII characters that are valid UTF-8 means 'utf-8'. A pure ASCII sample says
+# nothing about the rest of the file, so it is read as 'ISO-8859-1' like the original scripts did: that
+# accepts every byte, and reads ASCII and Latin-1 text further down intact.
+def detect_encoding(file_path, sample_size=SAMPLE_SIZE):
+    with open(file_path, 'rb') as file:
+        sample = file.read(sample_size)
+
+    if sample.startswith(codecs.BOM_UTF8):
+        return 'utf-8-sig'
+
+    try:
+        # final=False: a character cut in half at the end of the sample is not an error
+        codecs.getincrementaldecoder('utf-8')().decode(sample, final=False)
+    except UnicodeDecodeError:
+        return 'ISO-8859-1'
+    return 'ISO-8859-1' if sample.isascii() else 'utf-8'
+
+
+# Number of characters that could not be decoded and were replaced with U+FFFD
+def count_replaced(df):
+    text = df.select_dtypes(include='object')
+    return int(sum(text[column].str.count('\ufffd').sum() for column in text.columns))
+
+
+def _warn_replaced(count, file_path, encoding):
+    if count:
+        warnings.warn(f"{count} characters of {file_path} are not valid {encoding} and were replaced with "
+                      f"'\ufffd'; pass encoding='ISO-8859-1' (or the file's encoding) to read them intact.")
+
+
+def parse_dates(dates, date_format=DATE_FORMAT):
+    try:
+        return pd.to_datetime(dates, format=date_format)
+    except (ValueError, TypeError):
+        # Dataset with a different date layout: let pandas work it out
+        return pd.to_datetime(dates, format='mixed')
+
+
+# Reads the sales dataset in a single pass.
+# The encoding is sniffed from a sample; if a UTF-8 file has a bad byte further down, that byte is
+# replaced (with a warning giving the count) instead of failing and re-reading the whole file with
+# another encoding.
+def load_dataset(file_path, encoding=None, date_format=DATE_FORMAT, **read_csv_options):
+    if encoding is None:
+        encoding = detect_encoding(file_path)
+
+    df = pd.read_csv(file_path, encoding=encoding, encoding_errors='replace', dtype=DTYPES,
+                     **read_csv_options)
+    if DATE_COLUMN in df.columns:
+        df[DATE_COLUMN] = parse_dates(df[DATE_COLUMN], date_format)
+    _warn_replaced(count_replaced(df), file_path, encoding)
+
+    print(f"Successfully read the CSV file with '{encoding}' encoding.")
+    return df
+
+
+# Same as load_dataset, but yields the file in DataFrames of at most chunksize rows, so only one
+# chunk is in memory at a time.
+def load_dataset_chunks(file_path, chunksize=500_000, encoding=None, date_format=DATE_FORMAT, **read_csv_options):
+    if encoding is None:
+        encoding = detect_encoding(file_path)
+
+    with pd.read_csv(file_path, encoding=encoding, encoding_errors='replace', dtype=DTYPES,
+                     chunksize=chunksize, **read_csv_options) as reader:
+        replaced = 0
+        for chunk in reader:
+            if DATE_COLUMN in chunk.columns:
+                chunk[DATE_COLUMN] = parse_dates(chunk[DATE_COLUMN], date_format)
+            replaced += count_replaced(chunk)
+            yield chunk
+    _warn_replaced(replaced, file_path, encoding)
@@ -0,0 +1,58 @@
+import numpy as np
+from sklearn.base import clone
+from sklearn.decomposition import PCA, IncrementalPCA
+
+
+# Dimensionality reduction of kmeans_alg.py.
+# The decomposition is fitted once with every component (the spectrum, for the explained variance chart)
+# and the first k components are sliced out of it, without refitting, for the clustering.
+# Solvers:
+#   'exact'        PCA with every component (one SVD, or one eigendecomposition of the covariance matrix
+#                  when there are many more customers than features)
+#   'randomized'   randomized SVD of the first max_components components only, for large customer counts
+#   'incremental'  IncrementalPCA fitted batch by batch, so the data is never decomposed at once
+
+SOLVERS = ('exact', 'randomized', 'incremental')
+
+
+def fit_spectrum(X, solver='exact', max_components=None, batch_size=None, random_state=0):
+    if solver not in SOLVERS:
+        raise ValueError(f"Unknown PCA solver '{solver}', expected one of {SOLVERS}")
+    if solver == 'exact':
+        return PCA().fit(X)
+    if solver == 'randomized':
+        nComponents = max_components or min(X.shape)
+        return PCA(n_components=nComponents, svd_solver='randomized', random_state=random_state).fit(X)
+    return IncrementalPCA(n_components=max_components, batch_size=batch_size).fit(X)
+
+
+# Smallest number of components whose cumulative explained variance reaches target (e.g. 0.8), or all
+# the components of the spectrum if none does
+def components_for_variance(explainedVarianceRatio, target):
+    cumulative = np.cumsum(explainedVarianceRatio)
+    return int(min(np.searchsorted(cumulative, target) + 1, len(cumulative)))
+
+
+# The decomposition of the first n_components components of a fitted spectrum, as if it had been fitted
+# with n_components: transform, inverse_transform and the fitted attributes give the same results
+def truncate(spectrum, n_components):
+    available = len(spectrum.components_)
+    if not 1 <= n_components <= available:
+        raise ValueError(f"n_components must be between 1 and {available}, got {n_components}")
+
+    reduced = clone(spectrum).set_params(n_components=n_components)
+    reduced.__dict__.update({name: value for name, value in vars(spectrum).items() if name.endswith('_')})
+    for name in ('components_', 'explained_variance_', 'explained_variance_ratio_', 'singular_values_'):
+        setattr(reduced, name, getattr(spectrum, name)[:n_components])
+    reduced.n_components_ = n_components
+
+    # The average variance of the left out components, over the rank of the data
+    nSamples = getattr(spectrum, 'n_samples_', getattr(spectrum, 'n_samples_seen_', None))
+    rank = min(nSamples, spectrum.n_features_in_)
+    if n_components < rank:
+        totalVariance = spectrum.explained_variance_[0] / spectrum.explained_variance_ratio_[0]
+        reduced.noise_variance_ = (totalVariance - spectrum.explained_variance_[:n_components].sum()) / \
+            (rank - n_components)
+    else:
+        reduced.noise_variance_ = 0.0
+    return reduced
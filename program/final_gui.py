@@ -2,8 +2,9 @@ from PySide6.QtCore import Qt, QTimer
 from ui_final_form_gui import Ui_MainWindow
 from PySide6.QtWidgets import QApplication, QMainWindow, QPushButton,QVBoxLayout, QWidget, QFileDialog, QProgressBar, QTableWidget, QTableWidgetItem
 import subprocess
-import pandas as pd
 import os
+from result_store import read_results
+from report_renderer import available_charts, render_chart
 from PyQt6.QtCore import QDateTime, QUrl
 from PySide6.QtWebEngineWidgets import QWebEngineView
 
@@ -32,13 +33,13 @@ class MyGui(QMainWindow, Ui_MainWindow):
         
 
         self.tableWidget_3.setRowCount(4373)
-        load_excel_to_table('compares_results.xlsx',self.tableWidget_3)
+        load_results_to_table('compares_results',self.tableWidget_3)
 
         self.tableWidget.setRowCount(4068)
-        load_excel_to_table('kmeans_customer_recommendations.xlsx',self.tableWidget)
+        load_results_to_table('kmeans_customer_recommendations',self.tableWidget)
         
         self.tableWidget_2.setRowCount(4373)
-        load_excel_to_table('knn_customer_recommendations.xlsx',self.tableWidget_2)
+        load_results_to_table('knn_customer_recommendations',self.tableWidget_2)
         
         
         
@@ -115,9 +116,9 @@ class MyGui(QMainWindow, Ui_MainWindow):
             self.run_algorithms()
 
 
-def load_excel_to_table(file_path, table_widget):
-    # Read the Excel file, skipping the header row (header=0 means the first row is header)
-    df = pd.read_excel(file_path, header=0)
+def load_results_to_table(name, table_widget):
+    # Read the stored result (Parquet, Feather or Excel, see result_store.py)
+    df = read_results(name)
     
     # Get the number of rows and columns
     num_rows, num_cols = df.shape
@@ -154,7 +155,10 @@ class PopupWindow(QMainWindow):
         self.web_view = QWebEngineView()
         self.layout.addWidget(self.web_view)
 
-        # Path to the HTML file
-        html_file_path = os.path.join(os.path.dirname(__file__), '3d_visualization.html')
+        # Path to the HTML file, drawn from the saved chart data if it changed since it was last drawn
+        if 'clusters_3d' in available_charts():
+            html_file_path = os.path.abspath(render_chart('clusters_3d'))
+        else:
+            html_file_path = os.path.join(os.path.dirname(__file__), '3d_visualization.html')
         file_url = QUrl.fromLocalFile(html_file_path).toString()
         self.web_view.setUrl(file_url)
\ No newline at end of file
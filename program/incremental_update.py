@@ -0,0 +1,104 @@
+import numpy as np
+import pandas as pd
+from cleaning import clean_chunk
+from cluster_scoring import assign_clusters
+from comparison import compare_recommendations, comparison_mode
+from customer_features import build_customer_features
+from dataset_loader import load_dataset
+from interaction_matrix import update_interaction_matrix
+from kmeans_recommend import cluster_purchases, recommend_from_clusters, recommendation_columns
+from knn_recommend import recommend_all
+from model_store import load_artifact
+from result_store import read_results, write_patch
+from transaction_cache import load_clean_transactions, to_columnar
+
+# Incremental update of the recommendations for new transactions, without a full rerun.
+# Only the customers in the new transactions are touched: their interaction matrix rows, their feature
+# rows, their cluster (KMeans.predict with the saved models) and their recommendation rows. The results
+# of knn_alg.py, kmeans_alg.py and comparison.py are updated with patches (see result_store.py).
+# Other customers keep their recommendations until the next full run, even if one of their neighbours
+# bought something new.
+
+# Dataset of the last full run of knn_alg.py and kmeans_alg.py
+address = 'dataset.csv'
+# Every transaction since the last full run, in the dataset layout. The patches are recomputed from
+# the models of the full run, so the file should keep growing until the next full run.
+delta_address = 'new_transactions.csv'
+
+# Same settings as knn_alg.py
+n_neighbors = 5
+neighbour_weighting = 'uniform'
+batch_size = 256
+
+
+# New rows of the KNN recommendations for the customers in delta (raw transactions)
+def knn_patch(delta):
+    # Same cleaning as knn_alg.py
+    delta = delta.drop_duplicates().dropna(subset=['CustomerID', 'StockCode'])
+    # Guest orders only (no CustomerID)
+    if delta.empty:
+        return pd.DataFrame(columns=['CustomerID'] + [f'RecommendedProduct{i + 1}' for i in range(3)])
+
+    knn_artifact, knn_metadata = load_artifact('knn_index')
+    matrix, customer_index, product_index, rows = update_interaction_matrix(
+        knn_artifact['matrix'], knn_artifact['customer_index'], knn_artifact['product_index'], delta)
+
+    # The index of the full run is refitted on the updated matrix. With 'brute' this only prepares the rows,
+    # 'lsh' hashes every row again and 'ivf' retrains its clusters on every row, so a delta costs about a
+    # full fit of the index with those backends
+    knn = knn_artifact['index'].fit(matrix)
+    blocks = recommend_all(matrix, knn, customer_index, product_index, n_neighbors=n_neighbors,
+                           n_recommendations=3, batch_size=batch_size, weighting=neighbour_weighting, rows=rows)
+    return pd.concat(blocks, ignore_index=True)
+
+
+# New rows of the KMeans recommendations for the customers in delta (raw transactions), and the
+# customers that no longer get one (outliers, or a single transaction row)
+def kmeans_patch(delta):
+    # The row rules of clean_transactions, without its report (a delta can be empty once cleaned)
+    delta = clean_chunk(delta)
+    if delta.empty:
+        return pd.DataFrame(columns=recommendation_columns(3)), np.array([], dtype='float')
+    delta = to_columnar(delta)
+    history, _ = load_clean_transactions(address)
+
+    affected = delta['CustomerID'].unique()
+    transactions = pd.concat([history[history['CustomerID'].isin(affected)], delta], ignore_index=True)
+    reference_day = max(history['InvoiceDate'].max(), delta['InvoiceDate'].max()).normalize()
+
+    customer_data = build_customer_features(transactions, reference_day=reference_day)
+    customer_data['CustomerID'] = customer_data['CustomerID'].astype('float')
+    clustered, _ = assign_clusters(customer_data)
+
+    customer_purchases, _ = cluster_purchases(transactions, clustered)
+    recommendations = recommend_from_clusters(clustered[['CustomerID', 'cluster']], customer_purchases,
+                                              read_results('cluster_top_products', key='cluster'),
+                                              n_recommendations=3)
+
+    removed = np.setdiff1d(affected.astype('float'), recommendations['CustomerID'].to_numpy())
+    return recommendations, removed
+
+
+if __name__ == '__main__':
+    delta = load_dataset(delta_address)
+
+    knn_recommendations = knn_patch(delta)
+    write_patch(knn_recommendations, 'knn_customer_recommendations')
+
+    kmeans_recommendations, kmeans_removed = kmeans_patch(delta)
+    write_patch(kmeans_recommendations, 'kmeans_customer_recommendations', deleted=kmeans_removed)
+
+    # Comparison of the patched results, for the touched customers only
+    touched = np.union1d(knn_recommendations['CustomerID'].to_numpy(), kmeans_recommendations['CustomerID'])
+    touched = np.union1d(touched, kmeans_removed)
+    knn_results = read_results('knn_customer_recommendations')
+    kmeans_results = read_results('kmeans_customer_recommendations')
+    matching_customers = compare_recommendations(knn_results[knn_results['CustomerID'].isin(touched)],
+                                                 kmeans_results[kmeans_results['CustomerID'].isin(touched)],
+                                                 mode=comparison_mode)
+    write_patch(matching_customers, 'compares_results',
+                deleted=np.setdiff1d(touched, matching_customers['CustomerID'].to_numpy()))
+
+    print(f"Updated the recommendations of {len(touched)} customers "
+          f"({len(knn_recommendations)} KNN, {len(kmeans_recommendations)} KMeans, "
+          f"{len(kmeans_removed)} removed from the KMeans results)")
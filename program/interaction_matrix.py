@@ -0,0 +1,82 @@
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+
+# Builds the customer x product interaction matrix straight from the transaction columns.
+# Rows and columns are ordered like pivot_table would order them (sorted CustomerID / StockCode),
+# but only the non-zero cells are stored, so memory grows with the number of purchases
+# instead of customers * products.
+def build_interaction_matrix(df, customer_col='CustomerID', product_col='StockCode', value_col='Quantity',
+                             dtype=np.float64):
+    customer_codes, customers = pd.factorize(df[customer_col], sort=True)
+    product_codes, products = pd.factorize(df[product_col], sort=True)
+
+    matrix = sparse.csr_matrix(
+        (df[value_col].to_numpy(dtype=dtype), (customer_codes, product_codes)),
+        shape=(len(customers), len(products))
+    )
+    # Repeated (customer, product) pairs are summed like aggfunc='sum'; cells that cancel out to 0
+    # (e.g. an order and its cancellation) are dropped so they count as "not purchased".
+    matrix.sum_duplicates()
+    matrix.eliminate_zeros()
+
+    customer_index = pd.Index(customers, name=customer_col)
+    product_index = pd.Index(products, name=product_col)
+
+    return matrix, customer_index, product_index
+
+
+# Adds the quantities of the transactions in df to an interaction matrix built by build_interaction_matrix.
+# New customers and products get their own rows / columns, in sorted position like a full rebuild.
+# Returns the updated matrix and index maps, and the rows of the customers in df.
+def update_interaction_matrix(matrix, customer_index, product_index, df, customer_col='CustomerID',
+                              product_col='StockCode', value_col='Quantity'):
+    delta, delta_customers, delta_products = build_interaction_matrix(df, customer_col, product_col, value_col,
+                                                                      dtype=matrix.dtype)
+    customers = customer_index.union(delta_customers).rename(customer_col)
+    products = product_index.union(delta_products).rename(product_col)
+
+    old = matrix.tocoo()
+    new = delta.tocoo()
+    rows = np.concatenate([customers.get_indexer(customer_index)[old.row],
+                           customers.get_indexer(delta_customers)[new.row]])
+    columns = np.concatenate([products.get_indexer(product_index)[old.col],
+                              products.get_indexer(delta_products)[new.col]])
+
+    updated = sparse.csr_matrix((np.concatenate([old.data, new.data]), (rows, columns)),
+                                shape=(len(customers), len(products)))
+    updated.sum_duplicates()
+    updated.eliminate_zeros()
+
+    return updated, customers, products, customers.get_indexer(delta_customers)
+
+
+# The rows of matrix (columns product_index) in the column space of target_index, e.g. the products of
+# a saved neighbour index. Products that are not in target_index are dropped.
+def reindex_products(matrix, product_index, target_index):
+    columns = target_index.get_indexer(product_index)
+    cells = matrix.tocoo()
+    keep = columns[cells.col] >= 0
+    return sparse.csr_matrix((cells.data[keep], (cells.row[keep], columns[cells.col[keep]])),
+                             shape=(matrix.shape[0], len(target_index)))
+
+
+# Row numbers of the customers of matrix that are not in saved_index, or whose row differs from their
+# row of saved_matrix. Both matrices must have the same columns (see reindex_products).
+def changed_rows(matrix, customer_index, saved_matrix, saved_index):
+    saved_rows = saved_index.get_indexer(customer_index)
+    known = np.flatnonzero(saved_rows >= 0)
+    changed = saved_rows < 0
+
+    difference = sparse.csr_matrix(matrix[known] - saved_matrix[saved_rows[known]])
+    difference.eliminate_zeros()
+    changed[known] = difference.getnnz(axis=1) > 0
+    return np.flatnonzero(changed)
+
+
+# Same matrix with every purchased cell set to 1
+def binarize(matrix):
+    binary = (matrix > 0).astype(np.int8)
+    binary.eliminate_zeros()
+    return binary
@@ -0,0 +1,336 @@
+import numpy as np
+import seaborn as sns
+import matplotlib.pyplot as plt
+import matplotlib.gridspec as gridspec
+import plotly.express as px
+from matplotlib.colors import LinearSegmentedColormap
+from yellowbrick.utils import KneeLocator
+
+from plotly.offline import init_notebook_mode
+
+# Figures of kmeans_alg.py, drawn from the chart data the pipeline saves (see report_renderer.py).
+# Only the renderer imports this module, so a batch run never loads matplotlib, seaborn, plotly or
+# yellowbrick.
+# Every function sets the seaborn style it needs and saves its figure to path.
+
+init_notebook_mode(connected=True)
+
+
+def setDefaultStyle():
+    sns.set(rc={'axes.facecolor': '#fcf0dc'}, style='darkgrid')
+
+
+def plotMissingValues(missingPercentage, path='percentage_of_missing_values.jpg'):
+    setDefaultStyle()
+    fig, ax = plt.subplots(figsize=(15, 4))
+    ax.barh(missingPercentage.index, missingPercentage, color='red')
+
+    for i, (value, name) in enumerate(zip(missingPercentage, missingPercentage.index)):
+        ax.text(value + 0.5, i, f"{value:.2f}%", ha='left', va='center', fontweight='bold', fontsize=18,
+                color='black')
+
+    ax.set_xlim([0, 40])
+
+    plt.title("Percentage of Missing Values", fontweight='bold', fontsize=22)
+    plt.xlabel('Percentages (%)', fontsize=16)
+    plt.savefig(path, format='jpeg', dpi=300)
+    #plt.show()
+
+
+def plotTopStockCodes(top10StockCodes, path='top_10_stock_codes.jpg'):
+    setDefaultStyle()
+    plt.figure(figsize=(12, 5))
+    top10StockCodes.plot(kind='barh', color='darkblue')
+
+    for index, value in enumerate(top10StockCodes):
+        plt.text(value, index + 0.25, f'{value:.2f}%', fontsize=10)
+
+    plt.title('Top 10 Stock Codes')
+    plt.xlabel('Percentage Frequency (%)')
+    plt.ylabel('Stock Codes')
+    plt.gca().invert_yaxis()
+    plt.savefig(path, format='jpeg', dpi=300)
+    #plt.show()
+
+
+def plotTopDescriptions(top30Descriptions, path='number_of_occurrences.jpg'):
+    setDefaultStyle()
+    plt.figure(figsize=(12, 8))
+    plt.barh(top30Descriptions.index[::-1], top30Descriptions.values[::-1], color='#ff6200')
+
+    plt.xlabel('Number of Occurrences')
+    plt.ylabel('Description')
+    plt.title('Top 30 Most Frequent Descriptions')
+    plt.savefig(path, format='jpeg', dpi=300)
+    #plt.show()
+
+
+def plotOutliers(outlierPercentage, path='inliners_and_outliners.jpg'):
+    setDefaultStyle()
+    plt.figure(figsize=(12, 4))
+    outlierPercentage.plot(kind='barh', color='red')
+    for i, val in enumerate(outlierPercentage):
+        plt.text(val, i, f'{val:.2f}%', fontsize=15)
+
+        plt.title('Inliers and Outliers')
+        plt.xticks(ticks=np.arange(0, 115, 5))
+        plt.xlabel('Percentage')
+        plt.ylabel('Is Outlier')
+        plt.gca().invert_yaxis()
+        plt.savefig(path, format='jpeg', dpi=300)
+        #plt.show()
+
+
+# STEP 6
+def plotCorrelationMatrix(corr, path='correlation_matrix.jpg'):
+    sns.set_style('whitegrid')
+
+    colors = ['red', '#ffcaa8', 'white', '#ffcaa8', '#ff6200']
+    my_cmap = LinearSegmentedColormap.from_list('custom_map', colors, N=256)
+
+    mask = np.zeros_like(corr)
+    mask[np.triu_indices_from(mask, k=1)] = True
+
+    plt.figure(figsize=(12, 10))
+    sns.heatmap(corr, mask=mask, cmap=my_cmap, annot=True, center=0, fmt='.2f', linewidths=2)
+    plt.title('Correlation Matrix', fontsize=14)
+    plt.savefig(path, format='jpeg', dpi=300)
+    #plt.show()
+
+
+# STEP 8
+def plotExplainedVariance(explainedVarianceRatio, optimal_k, path='CV_vs_NoC.jpg'):
+    cumulativeExplainedVariance = np.cumsum(explainedVarianceRatio)
+
+    setDefaultStyle()
+
+    plt.figure(figsize=(20, 10))
+
+    barplot = sns.barplot(x=list(range(1, len(cumulativeExplainedVariance) + 1)),
+                            y=explainedVarianceRatio,
+                            color='#fcc36d',
+                            alpha=0.8)
+
+    lineplot, = plt.plot(range(0, len(cumulativeExplainedVariance)), cumulativeExplainedVariance,
+                            marker='o', linestyle='--', color='#ff6200', linewidth=2)
+
+    optimal_k_line = plt.axvline(optimal_k - 1, color='red', linestyle='--', label=f'Optimal k value = {optimal_k}')
+
+    plt.xlabel('Number of Components', fontsize=14)
+    plt.ylabel('Explained Variance', fontsize=14)
+    plt.title('Cumulative Variance vs. Number of Components', fontsize=18)
+
+    plt.xticks(range(0, len(cumulativeExplainedVariance)))
+    plt.legend(handles=[barplot.patches[0], lineplot, optimal_k_line],
+                labels=['Explained Variance of Each Component', 'Cumulative Explained Variance',
+                        f'Optimal k value = {optimal_k}'],
+                loc=(0.62, 0.1),
+                frameon=True,
+                framealpha=1.0,
+                edgecolor='#ff6200')
+
+    x_offset = -0.3
+    y_offset = 0.01
+    for i, (ev_ratio, cum_ev_ratio) in enumerate(zip(explainedVarianceRatio, cumulativeExplainedVariance)):
+        plt.text(i, ev_ratio, f"{ev_ratio:.2f}", ha="center", va="bottom", fontsize=10)
+        if i > 0:
+            plt.text(i + x_offset, cum_ev_ratio + y_offset, f"{cum_ev_ratio:.2f}", ha="center", va="bottom",
+                        fontsize=10)
+
+    plt.grid(axis='both')
+    plt.savefig(path, format='jpeg', dpi=300)
+    #plt.show()
+
+
+# STEP 9
+# inertias: inertia of the fitted model per k (indexed by k). The elbow is found like yellowbrick's
+# KElbowVisualizer finds it.
+def plotElbow(inertias, path='elbow.jpg'):
+    sns.set(style='darkgrid', rc={'axes.facecolor': '#fcf0dc'})
+    sns.set_palette(['#ff6200'])
+
+    fig, ax = plt.subplots(figsize=(12, 5))
+
+    ax.plot(inertias.index, inertias.to_numpy(), marker='D')
+    elbow = KneeLocator(list(inertias.index), list(inertias.to_numpy()), curve_nature='convex',
+                        curve_direction='decreasing')
+    if elbow.knee is not None:
+        ax.axvline(elbow.knee, color='black', linestyle='--',
+                   label=f'elbow at $k={elbow.knee}$, $score={inertias[elbow.knee]:0.3f}$')
+        ax.legend(loc='best', fontsize='medium', frameon=True)
+
+    ax.set_title('Distortion Score Elbow for KMeans Clustering')
+    ax.set_xlabel('k')
+    ax.set_ylabel('distortion score')
+    plt.savefig(path, format='jpeg', dpi=300)
+    #plt.show()
+
+
+# silhouetteScores: average silhouette score per k (indexed by k); intervals: its confidence interval
+# per k (columns low and high), drawn as a band when the scores are estimated from a sample
+def plotSilhouetteScores(silhouetteScores, intervals=None, path='avg_silhouette_scores.jpg'):
+    setDefaultStyle()
+    sns.set_palette(['darkorange'])
+
+    plt.figure(figsize=(20, 5))
+
+    best_k = silhouetteScores.idxmax()
+
+    plt.plot(silhouetteScores.index, silhouetteScores.to_numpy(), marker='o')
+    if intervals is not None and (intervals['high'] > intervals['low']).any():
+        plt.fill_between(intervals.index, intervals['low'].to_numpy(dtype=float),
+                         intervals['high'].to_numpy(dtype=float), alpha=0.3)
+    plt.xticks(silhouetteScores.index)
+    plt.xlabel('Number of clusters (k)')
+    plt.ylabel('Silhouette score')
+    plt.title('Average Silhouette Score for Different k Values', fontsize=15)
+
+    optimal_k_text = f'The k value with the highest Silhouette score is: {best_k}'
+    plt.text(0.6, 0.1, optimal_k_text, fontsize=12, verticalalignment='bottom',
+                horizontalalignment='left', transform=plt.gca().transAxes,
+                bbox=dict(facecolor='#fcc36d', edgecolor='#ff6200', boxstyle='round, pad=0.5'))
+
+    plt.savefig(path, format='jpeg', dpi=300)
+    #plt.show()
+
+
+# Silhouette plot of every k, two per row.
+# silhouetteSamples: {k: (silhouette value of every sample, cluster labels)}
+def silhouettePlots(silhouetteSamples, figsize=(15, 16), path='avg_silhouette_scot_for_k.jpg'):
+    sns.set(style='darkgrid', rc={'axes.facecolor': '#fcf0dc'})
+    sns.set_palette(['darkorange'])
+    plt.figure(figsize=figsize)
+
+    grid = gridspec.GridSpec((len(silhouetteSamples) + 1) // 2, 2)
+
+    colors = sns.color_palette("bright")
+
+    for position, (i, (values, labels)) in enumerate(sorted(silhouetteSamples.items())):
+        row_idx, col_idx = divmod(position, 2)
+
+        ax = plt.subplot(grid[row_idx, col_idx])
+
+        # One band of sorted silhouette values per cluster, like yellowbrick's SilhouetteVisualizer
+        y_lower = 10
+        for cluster in range(i):
+            clusterValues = np.sort(values[labels == cluster])
+            y_upper = y_lower + len(clusterValues)
+            ax.fill_betweenx(np.arange(y_lower, y_upper), 0, clusterValues, facecolor=colors[cluster % len(colors)],
+                             edgecolor=colors[cluster % len(colors)], alpha=0.5)
+            ax.text(-0.05, y_lower + 0.5 * len(clusterValues), str(cluster))
+            y_lower = y_upper + 10
+
+        score = values.mean()
+        ax.axvline(x=score, color='red', linestyle='--')
+        ax.set_yticks([])
+        ax.set_ylim(0, y_lower)
+        ax.set_xlabel('silhouette coefficient values')
+        ax.set_ylabel('cluster label')
+        ax.text(0.97, 0.02, f'Silhouette Score: {score:.2f}', fontsize=12, \
+                ha='right', transform=ax.transAxes, color='red')
+
+        ax.set_title(f'Silhouette Plot for {i} Clusters', fontsize=15)
+
+    plt.tight_layout()
+    plt.savefig(path, format='jpeg', dpi=300)
+    #plt.show()
+
+
+# STEP 10
+def plotClusters3d(customerDataPCA, colors, path='3d_visualization.html'):
+    fig = px.scatter_3d(customerDataPCA, x='PC1', y='PC2', z='PC3', color='cluster',
+                        color_discrete_sequence=colors, opacity=0.4,
+                        title='3D Visualization of Customer Clusters in PCA Space',
+                        labels={'PC1': 'PC1', 'PC2': 'PC2', 'PC3': 'PC3'},
+                        category_orders={'cluster': [0, 1, 2]})
+
+    fig.update_layout(scene=dict(
+        xaxis=dict(backgroundcolor="#fcf0dc", gridcolor='white'),
+        yaxis=dict(backgroundcolor="#fcf0dc", gridcolor='white'),
+        zaxis=dict(backgroundcolor="#fcf0dc", gridcolor='white')
+    ), width=900, height=800)
+
+    # Save the figure as an HTML file
+    fig.write_html(path)
+
+    # Open the HTML file in the default web browser
+    # webbrowser.open("3d_visualization.html", new=2)
+
+
+def plotClusterDistribution(clusterPercentage, colors, path='dist_of_customers_across_clusters.jpg'):
+    setDefaultStyle()
+    plt.figure(figsize=(10, 4))
+    sns.barplot(x='Percentage', y='Cluster', data=clusterPercentage, orient='h', palette=colors)
+
+    for index, value in enumerate(clusterPercentage['Percentage']):
+        plt.text(value + 0.5, index, f'{value:.2f}%')
+
+    plt.title('Distribution of Customers Across Clusters', fontsize=14)
+    plt.xticks(ticks=np.arange(0, 50, 5))
+    plt.xlabel('Percentage (%)')
+    plt.savefig(path, format='jpeg', dpi=300)
+    #plt.show()
+
+
+# STEP 11
+def createRadarChart(ax, angles, data, color, cluster):
+    ax.fill(angles, data, color=color, alpha=0.4)
+    ax.plot(angles, data, color=color, linewidth=2, linestyle='solid')
+    ax.set_title(f'Cluster {cluster}', size=20, color=color, y=1.1)
+
+
+def plotRadarCharts(clusterCentroids, colors, path='cluster_radar_charts.jpg'):
+    setDefaultStyle()
+    labels = np.array(clusterCentroids.columns)
+    numVars = len(labels)
+
+    angles = np.linspace(0, 2 * np.pi, numVars, endpoint=False).tolist()
+
+    labels = np.concatenate((labels, [labels[0]]))
+    angles += angles[:1]
+
+    fig, ax = plt.subplots(figsize=(20, 10), subplot_kw=dict(polar=True), nrows=1, ncols=3)
+
+    for i, color in enumerate(colors):
+        data = clusterCentroids.loc[i].tolist()
+        data += data[:1]
+        createRadarChart(ax[i], angles, data, color, i)
+
+    ax[0].set_xticks(angles[:-1])
+    ax[0].set_xticklabels(labels[:-1])
+
+    ax[1].set_xticks(angles[:-1])
+    ax[1].set_xticklabels(labels[:-1])
+
+    ax[2].set_xticks(angles[:-1])
+    ax[2].set_xticklabels(labels[:-1])
+
+    ax[0].grid(color='grey', linewidth=0.5)
+
+    plt.tight_layout()
+    plt.savefig(path, format='jpeg', dpi=300)
+    #plt.show()      # Umuta sor bu neyi show ediyor tam olarak title lazım
+
+
+# featureHistograms: {(feature, cluster): (counts, bin edges)}, see report_renderer.histogram_table
+def plotFeatureHistograms(featureHistograms, colors, path='cluster_feature_histograms.jpg'):
+    setDefaultStyle()
+    features = list(dict.fromkeys(feature for feature, _ in featureHistograms))
+    clusters = sorted(set(cluster for _, cluster in featureHistograms))
+
+    nRows = len(features)
+    nCols = len(clusters)
+    fig, axes = plt.subplots(nRows, nCols, figsize=(20, 3 * nRows), squeeze=False)
+
+    for i, feature in enumerate(features):
+        for j, cluster in enumerate(clusters):
+            counts, edges = featureHistograms[(feature, cluster)]
+            axes[i, j].bar(edges[:-1], counts, width=np.diff(edges), align='edge', color=colors[j], edgecolor='w',
+                           alpha=0.7)
+            axes[i, j].set_title(f'Cluster {cluster} - {feature}', fontsize=15)
+            axes[i, j].set_xlabel('')
+            axes[i, j].set_ylabel('')
+
+    plt.tight_layout()
+    plt.savefig(path, format='jpeg', dpi=300)
+    #plt.show()      # Umuta sor title lazım
@@ -0,0 +1,58 @@
+import numpy as np
+import pandas as pd
+
+
+def recommendation_columns(n_recommendations=3):
+    columns = ['CustomerID', 'cluster']
+    for i in range(1, n_recommendations + 1):
+        columns += [f'Recommendation {i} Stock Code', f'Recommendation {i} Description']
+    return columns
+
+
+# What every customer of customerClusters bought and the top n_top products of every cluster by quantity,
+# the inputs of recommend_from_clusters
+def cluster_purchases(df, customerClusters, n_top=10):
+    mergedData = df.merge(customerClusters[['CustomerID', 'cluster']], on='CustomerID', how='inner')
+
+    bestSellingProducts = mergedData.groupby(['cluster', 'StockCode', 'Description'],
+                                              observed=True)['Quantity'].sum().reset_index()
+    bestSellingProducts = bestSellingProducts.sort_values(by=['cluster', 'Quantity'], ascending=[True, False])
+    topProductsPerCluster = bestSellingProducts.groupby('cluster').head(n_top)
+
+    customerPurchases = mergedData.groupby(['CustomerID', 'cluster', 'StockCode'],
+                                            observed=True)['Quantity'].sum().reset_index()
+    return customerPurchases, topProductsPerCluster
+
+
+# STEP 12 of kmeans_alg.py: every customer gets the first n_recommendations products of its cluster's
+# top list that it has not purchased yet.
+# Every customer is paired with its cluster's top products in one join, the products it already bought
+# are removed with one anti-join on (CustomerID, StockCode) and the first n per customer are kept, so
+# the purchases are only looked at once instead of once per customer.
+# Rows are ordered by cluster and then in customerClusters order; missing recommendations are NaN.
+def recommend_from_clusters(customerClusters, customerPurchases, topProductsPerCluster, n_recommendations=3):
+    topProducts = topProductsPerCluster[['cluster', 'StockCode', 'Description']].copy()
+    topProducts['StockCode'] = topProducts['StockCode'].astype(object)
+
+    customers = customerClusters[['CustomerID', 'cluster']]
+    customers = customers[customers['cluster'].isin(topProducts['cluster'].unique())]
+    customers = customers.iloc[np.argsort(customers['cluster'].to_numpy(), kind='stable')].reset_index(drop=True)
+
+    candidates = customers.merge(topProducts, on='cluster', how='inner')
+
+    purchased = customerPurchases[['CustomerID', 'StockCode']].drop_duplicates()
+    purchased = purchased.assign(StockCode=purchased['StockCode'].astype(object), Purchased=True)
+    candidates = candidates.merge(purchased, on=['CustomerID', 'StockCode'], how='left')
+    notPurchased = candidates[candidates['Purchased'].isna()]
+
+    best = notPurchased.groupby('CustomerID', sort=False).head(n_recommendations)
+    best = best.assign(position=best.groupby('CustomerID', sort=False).cumcount() + 1)
+
+    wide = best.pivot(index='CustomerID', columns='position', values=['StockCode', 'Description'])
+    wide = wide.reindex(columns=pd.MultiIndex.from_product([['StockCode', 'Description'],
+                                                            range(1, n_recommendations + 1)]))
+    wide.columns = [f'Recommendation {position} {"Stock Code" if field == "StockCode" else "Description"}'
+                    for field, position in wide.columns]
+
+    recommendationsDF = customers.merge(wide, left_on='CustomerID', right_index=True, how='left')
+    return recommendationsDF[recommendation_columns(n_recommendations)]
@@ -0,0 +1,35 @@
+from transaction_cache import load_clean_transactions
+from customer_features import build_customer_features
+from cluster_scoring import assign_clusters
+from kmeans_recommend import cluster_purchases, recommend_from_clusters
+from result_store import write_results
+
+# Scoring-only run of kmeans_alg.py.
+# The outlier detector, scaler, PCA and KMeans saved by the last kmeans_alg.py run are loaded instead of
+# refitted, so the customers of the dataset are assigned to the existing clusters and get their
+# recommendations without any training or figures.
+
+address = 'dataset.csv'
+
+# Format of the stored recommendations ('parquet', 'feather' or 'excel'), and whether to also export an Excel report
+resultFormat = 'parquet'
+excelReport = False
+
+df, cleaningReport = load_clean_transactions(address)
+
+customerData = build_customer_features(df)
+customerData['CustomerID'] = customerData['CustomerID'].astype('float')
+
+# Outliers are left out, as in training
+customerDataCleaned, kMeansMetadata = assign_clusters(customerData)
+
+print(f"Assigned {len(customerDataCleaned)} customers to clusters with kmeans v{kMeansMetadata['version']} "
+      f"({len(customerData) - len(customerDataCleaned)} outliers left out)")
+
+customerPurchases, topProductsPerCluster = cluster_purchases(df, customerDataCleaned, n_top=10)
+
+recommendationsDF = recommend_from_clusters(customerDataCleaned[['CustomerID', 'cluster']], customerPurchases,
+                                            topProductsPerCluster, n_recommendations=3)
+
+write_results(topProductsPerCluster, 'cluster_top_products', format=resultFormat)
+write_results(recommendationsDF, 'kmeans_customer_recommendations', format=resultFormat, excel_report=excelReport)
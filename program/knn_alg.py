@@ -1,114 +1,144 @@
 import pandas as pd
-from sklearn.neighbors import NearestNeighbors
 import numpy as np
+from dataset_loader import load_dataset
+from chunked_ingestion import InteractionCounts, ingest_chunks
+from interaction_matrix import build_interaction_matrix, binarize, changed_rows, reindex_products
+from neighbour_index import build_index, recall_report
+from knn_recommend import recommend_all, score_candidates, neighbour_weights, top_n_products
+from result_store import write_patch, write_results
+from model_store import data_fingerprint, load_artifact, save_artifact
 
 
 
 # Load the CSV data
 file_path = 'dataset.csv'  # Change this to your CSV file's path
-# Try different encodings if UTF-8 fails
-possible_encodings = ['utf-8', 'ISO-8859-1', 'cp1252']
-
-df = None
-for encoding in possible_encodings:
-    try:
-        df = pd.read_csv(file_path, encoding=encoding)
-        print(f"Successfully read the CSV file with '{encoding}' encoding.")
-        break
-    except UnicodeDecodeError as e:
-        print(f"Failed to read with '{encoding}' encoding: {e}")
-    except Exception as e:
-        print(f"An error occurred: {e}")
-
-if df is None:
-    raise Exception("Failed to read the CSV file with all attempted encodings.")
-
-# If successfully read, proceed with the rest of the code
-print("First few rows of the dataframe:")
-print(df.head())
-
-# Data cleaning
-# Drop duplicates in case there are any, and remove rows with missing values
-df.drop_duplicates(inplace=True)
-df.dropna(subset=['CustomerID', 'StockCode'], inplace=True)
-
-# Create a mapping from StockCode to Description
-product_descriptions = df.drop_duplicates(subset=['StockCode']).set_index('StockCode')['Description']
-
-
-# Create a pivot table to get customer-product interactions
-# This creates a binary matrix where rows are customers and columns are products
-customer_product_matrix = (
-    df.pivot_table(index='CustomerID', columns='StockCode', values='Quantity', aggfunc='sum')
-    .fillna(0)
-    # .applymap(lambda x: 1 if x > 0 else 0)
-)
-
-# Instead of .applymap, use .apply with lambda to create a binary matrix
-customer_product_binary_matrix = customer_product_matrix.apply(
-    lambda x: x.map(lambda y: 1 if y > 0 else 0), axis=1
-)
-
-# Create the KNN model using KDTree
-knn = NearestNeighbors(metric='euclidean', algorithm='kd_tree', n_neighbors=5)
-
-# Fit the model to the customer-product matrix
-knn.fit(customer_product_matrix)
+# Set to a number of rows (e.g. 500_000) to read the file in chunks when it does not fit in memory
+chunk_size = None
+
+# Neighbour search settings
+neighbour_backend = 'brute'     # 'brute' (exact), 'ivf' or 'lsh' (approximate)
+neighbour_metric = 'euclidean'  # 'euclidean', 'cosine' or 'jaccard'
+neighbour_options = {}          # extra backend options, e.g. {'n_probe': 8} for 'ivf', {'n_tables': 8, 'n_bits': 12} for 'lsh'
+# How neighbours are counted when scoring products: 'uniform' or 'distance' (closer neighbours count more)
+neighbour_weighting = 'uniform'
+# Number of customers whose recommendations are computed together
+batch_size = 256
+# Set to True to print recall and speed of the approximate backends against exact search
+print_recall_report = False
+# Set to True to recommend with the neighbour index saved by the last full run, without refitting it.
+# The dataset is read as usual, and only the customers that are new or whose purchases changed since that
+# run are looked up in the saved index; their rows are stored as a patch of the previous recommendations.
+scoring_only = False
+
+# Format of the stored recommendations ('parquet', 'feather' or 'excel'), and whether to also export an Excel report
+result_format = 'parquet'
+excel_report = False
+
+if chunk_size is None:
+    # The encoding is detected from the start of the file, so the file is only read once
+    df = load_dataset(file_path)
+
+    # If successfully read, proceed with the rest of the code
+    print("First few rows of the dataframe:")
+    print(df.head())
+
+    # Data cleaning
+    # Drop duplicates in case there are any, and remove rows with missing values
+    df.drop_duplicates(inplace=True)
+    df.dropna(subset=['CustomerID', 'StockCode'], inplace=True)
+
+    # Create a mapping from StockCode to Description
+    product_descriptions = df.drop_duplicates(subset=['StockCode']).set_index('StockCode')['Description']
+
+    # Build the sparse customer-product interaction matrix (rows: customers, columns: products).
+    # Only the purchased cells are stored, so this scales to a full year of orders.
+    customer_product_matrix, customer_index, product_index = build_interaction_matrix(df)
+else:
+    # Read the file in chunks. Every chunk is cleaned with the kmeans_alg.py rules and only the
+    # customer-product quantity sums are kept, so memory does not grow with the file size.
+    interaction_counts, = ingest_chunks(file_path, [InteractionCounts()], chunksize=chunk_size)
+    customer_product_matrix, customer_index, product_index = interaction_counts.result()
+
+# Binary version of the same matrix: 1 if the customer bought the product, 0 otherwise
+customer_product_binary_matrix = binarize(customer_product_matrix)
+
+if scoring_only:
+    knn_artifact, knn_metadata = load_artifact('knn_index')
+    print(f"Loaded the neighbour index v{knn_metadata['version']} ({knn_metadata['created']})")
+    knn = knn_artifact['index']
+    indexed_matrix = knn_artifact['matrix']
+    indexed_products = knn_artifact['product_index']
+
+    # The current rows in the product columns of the saved index (products it has never seen cannot be
+    # recommended with it), and the customers whose rows are not the ones it was built on
+    query_matrix = reindex_products(customer_product_matrix, product_index, indexed_products)
+    query_rows = changed_rows(query_matrix, customer_index, indexed_matrix, knn_artifact['customer_index'])
+    print(f"{len(query_rows)} new or changed customers since the saved index")
+else:
+    indexed_matrix = query_matrix = customer_product_matrix
+    indexed_products = product_index
+    query_rows = None
+
+    # Create the KNN model on top of the selected neighbour index
+    knn = build_index(neighbour_backend, metric=neighbour_metric, n_neighbors=5, **neighbour_options)
+
+    # Fit the model to the customer-product matrix
+    knn.fit(customer_product_matrix)
+
+    # Save the fitted index with the matrix it was built on, for scoring_only runs
+    save_artifact({'index': knn, 'matrix': customer_product_matrix, 'customer_index': customer_index,
+                   'product_index': product_index},
+                  'knn_index', product_index.astype(str), data_fingerprint(customer_product_matrix),
+                  extra={'backend': neighbour_backend, 'metric': neighbour_metric,
+                         'options': neighbour_options})
+
+if print_recall_report:
+    print(recall_report(customer_product_matrix, [
+        {'backend': 'ivf', 'n_probe': 4},
+        {'backend': 'ivf', 'n_probe': 8},
+        {'backend': 'ivf', 'n_probe': 16},
+        {'backend': 'lsh', 'n_tables': 8, 'n_bits': 12},
+        {'backend': 'lsh', 'n_tables': 16, 'n_bits': 10},
+    ], metric=neighbour_metric, n_neighbors=5))
 
 # Function to get recommendations for a given customer
 def get_recommendations(customer_id, n_recommendations=3):
-    customer_index = customer_product_matrix.index.get_loc(customer_id)
-    distances, indices = knn.kneighbors(customer_product_matrix.iloc[[customer_index]])
+    customer_row = customer_index.get_loc(customer_id)
+    customer_products = query_matrix[customer_row]
+    distances, indices = knn.kneighbors(customer_products)
     
-    similar_customers = indices[0]
-    customer_products = customer_product_matrix.iloc[customer_index]
-    
-    # Find products that the customer has not purchased
-    non_purchased_products = customer_product_matrix.columns[customer_products == 0]
-    
-    # Count the number of similar customers who have purchased each non-purchased product
-    product_recommendations = non_purchased_products.to_series().apply(
-        lambda product: customer_product_matrix.iloc[similar_customers][product].sum()
-    )
+    # Count the similar customers who have purchased each product the customer has not purchased
+    product_recommendations = score_candidates(indexed_matrix, indices, customer_products,
+                                               neighbour_weights(distances, neighbour_weighting))
     
     # Get the top n_recommendations products
-    top_recommendations = product_recommendations.nlargest(n_recommendations).index.tolist()
+    top_recommendations = top_n_products(product_recommendations, n_recommendations)[0]
     
-    return top_recommendations
+    return indexed_products[top_recommendations[top_recommendations >= 0]].tolist()
 
-# Generate recommendations for each customer and store them in a list
+# Generate recommendations for all customers (or the new and changed ones), one block of customers at a time.
+# Every block has one column per recommendation, padded with None if there are fewer than 3.
+n_customers = len(customer_index) if query_rows is None else len(query_rows)
 recommendations_list = []
 
-# for customer_id in customer_product_matrix.index:
-#     recommendations = get_recommendations(customer_id)
-#     recommendations_list.append({
-#         'CustomerID': customer_id,
-#         'RecommendedProducts': recommendations
-#     })
-#     # print(recommendations_list)
-#     # print("---------------------------")
-#     print(customer_id)
-
-#   Burası her bir özelliğe bir kolon ayırıyor.
-for customer_id in customer_product_matrix.index:
-    recommendations = get_recommendations(customer_id)
-    # Ensure that the length of recommendations is always n_recommendations
-    while len(recommendations) < 3:
-        recommendations.append(None)  # Pad with None if fewer than 3 recommendations
-    recommendations_list.append({
-        'CustomerID': customer_id,
-        'RecommendedProduct1': recommendations[0],
-        'RecommendedProduct2': recommendations[1],
-        'RecommendedProduct3': recommendations[2]
-    })
-    print(customer_id)
-
-
-
-# Convert the recommendations list to a DataFrame and save to CSV
-recommendations_df = pd.DataFrame(recommendations_list)
-
-output_path = 'knn_customer_recommendations.xlsx'  # Change this to your desired output file name
-recommendations_df.to_excel(output_path, index=False)
-
-print("Recommendations saved to", output_path)
+for recommendations_block in recommend_all(indexed_matrix, knn, customer_index, indexed_products,
+                                           n_neighbors=5, n_recommendations=3, batch_size=batch_size,
+                                           weighting=neighbour_weighting, rows=query_rows, queries=query_matrix):
+    recommendations_list.append(recommendations_block)
+    print(f"{recommendations_block['CustomerID'].iloc[-1]} "
+          f"({sum(len(block) for block in recommendations_list)}/{n_customers} customers)")
+
+# Combine the blocks into one DataFrame and save it
+if not scoring_only:
+    recommendations_df = pd.concat(recommendations_list, ignore_index=True)
+
+    output_path = write_results(recommendations_df, 'knn_customer_recommendations', format=result_format,
+                                excel_report=excel_report)
+
+    print("Recommendations saved to", output_path)
+elif recommendations_list:
+    # The other customers keep the recommendations of the previous run
+    output_path = write_patch(pd.concat(recommendations_list, ignore_index=True), 'knn_customer_recommendations',
+                              format=result_format)
+
+    print("Recommendations of the new and changed customers saved to", output_path)
@@ -0,0 +1,102 @@
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+
+# Picks the n best products of every row of a dense score block with argpartition.
+# Ties are broken by column position (the same order nlargest would return), and cells
+# scored -inf (already purchased) are never picked. Rows with fewer candidates are padded with -1.
+def top_n_products(scores, n):
+    n_rows, n_products = scores.shape
+    n = min(n, n_products)
+    if n == 0:
+        return np.full((n_rows, 0), -1, dtype=np.intp)
+
+    candidates = np.argpartition(-scores, n - 1, axis=1)[:, :n]
+    candidate_scores = np.take_along_axis(scores, candidates, axis=1)
+    # Score of the n-th best product of every row
+    kth_score = candidate_scores.min(axis=1, keepdims=True)
+
+    # argpartition keeps any of the products tied with the n-th score. In the rows where it left some
+    # of them out, the first ones in column order are taken instead.
+    tied = scores == kth_score
+    unsettled = np.flatnonzero(np.isfinite(kth_score[:, 0]) &
+                               (tied.sum(axis=1) > (candidate_scores == kth_score).sum(axis=1)))
+    if len(unsettled):
+        above = scores[unsettled] > kth_score[unsettled]
+        missing = n - above.sum(axis=1, keepdims=True)
+        chosen = above | (tied[unsettled] & (np.cumsum(tied[unsettled], axis=1) <= missing))
+        candidates[unsettled] = np.nonzero(chosen)[1].reshape(len(unsettled), n)
+
+    # Best first, ties in column order
+    candidates = np.sort(candidates, axis=1)
+    candidate_scores = np.take_along_axis(scores, candidates, axis=1)
+    order = np.argsort(-candidate_scores, axis=1, kind='stable')
+    result = np.take_along_axis(candidates, order, axis=1)
+    result[np.isneginf(np.take_along_axis(candidate_scores, order, axis=1))] = -1
+    return result
+
+
+WEIGHTINGS = ('uniform', 'distance')
+
+
+# Weight of every neighbour in the score. 'uniform' counts every neighbour once (a plain sum of their
+# purchases), 'distance' gives closer neighbours more say with 1 / (1 + distance).
+def neighbour_weights(distances, weighting='uniform'):
+    if weighting not in WEIGHTINGS:
+        raise ValueError(f"Unknown weighting '{weighting}', expected one of {WEIGHTINGS}")
+    distances = np.asarray(distances, dtype=np.float64)
+    if weighting == 'uniform':
+        return np.ones_like(distances)
+    return 1 / (1 + distances)
+
+
+# Scoring kernel: for every customer, the weighted row-sum of its neighbours' rows of the matrix.
+# neighbours holds matrix row numbers (one row of neighbours per customer) and purchased holds the
+# customers' own matrix rows, whose non-zero cells are masked with -inf so they are never recommended.
+# Returns a dense (customers x products) score array.
+def score_candidates(matrix, neighbours, purchased, weights=None):
+    neighbours = np.atleast_2d(neighbours)
+    n_rows, n_neighbours = neighbours.shape
+    if weights is None:
+        weights = np.ones(neighbours.shape)
+
+    selection = sparse.csr_matrix(
+        (np.asarray(weights, dtype=np.float64).ravel(),
+         (np.repeat(np.arange(n_rows), n_neighbours), neighbours.ravel())),
+        shape=(n_rows, matrix.shape[0])
+    )
+    scores = (selection @ matrix).toarray()
+    scores[purchased.nonzero()] = -np.inf
+    return scores
+
+
+# Recommendations for every customer (or only the matrix rows in rows), computed a block of customers
+# at a time. For each block the neighbours are looked up in one query, scored with score_candidates
+# (one sparse matrix product per block) and the top products are taken with argpartition.
+# queries are other customer rows in the column space of matrix (e.g. the current transactions against a
+# saved index): their neighbours are looked up among the rows of matrix, and customer_index and rows
+# then refer to queries.
+# Yields one DataFrame per block in the knn_customer_recommendations layout.
+def recommend_all(matrix, index, customer_index, product_index, n_neighbors=5, n_recommendations=3,
+                  batch_size=256, weighting='uniform', rows=None, queries=None):
+    matrix = sparse.csr_matrix(matrix)
+    queries = matrix if queries is None else sparse.csr_matrix(queries)
+    if rows is None:
+        rows = np.arange(queries.shape[0])
+    products = np.append(np.asarray(product_index, dtype=object), None)
+    columns = [f'RecommendedProduct{i + 1}' for i in range(n_recommendations)]
+
+    for start in range(0, len(rows), batch_size):
+        block_rows = rows[start:start + batch_size]
+        block = queries[block_rows]
+        distances, neighbours = index.kneighbors(block, n_neighbors=n_neighbors)
+
+        scores = score_candidates(matrix, neighbours, block, neighbour_weights(distances, weighting))
+
+        top = top_n_products(scores, n_recommendations)
+        recommended = pd.DataFrame(products[top], columns=columns[:top.shape[1]])
+        for column in columns[top.shape[1]:]:
+            recommended[column] = None
+        recommended.insert(0, 'CustomerID', customer_index[block_rows])
+        yield recommended
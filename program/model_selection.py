@@ -0,0 +1,92 @@
+import time
+
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed
+from sklearn.cluster import KMeans
+from sklearn.metrics import calinski_harabasz_score, davies_bouldin_score
+from threadpoolctl import threadpool_limits
+
+from silhouette import SilhouetteEvaluator
+
+
+# Model selection for kmeans_alg.py.
+# ModelSweep spreads the KMeans fits of every (k, init seed) pair over joblib's worker processes. The data
+# is dumped once to a memory-mapped file that every worker opens read-only, instead of being sent with
+# every task. The workers do not import the calling script, so kmeans_alg.py runs without a __main__ guard
+# under the spawn start method too. The best fit of every k is kept and shared by everything that needs
+# it: the elbow curve, the silhouette scores and plots, the metrics table and the final model.
+
+# Settings of every KMeans fit in kmeans_alg.py
+KMEANS_PARAMS = {'init': 'k-means++', 'n_init': 10, 'max_iter': 100, 'random_state': 0}
+
+
+# The workers already use every core, so each task runs single-threaded
+def _fit_task(X, k, seed, params):
+    with threadpool_limits(limits=1):
+        start = time.perf_counter()
+        model = KMeans(n_clusters=k, **{**params, 'random_state': seed}).fit(X)
+        return model, time.perf_counter() - start
+
+
+def _score_task(X, labels, evaluator):
+    with threadpool_limits(limits=1):
+        start = time.perf_counter()
+        values, rows = evaluator.samples(X, labels)
+        silhouette = evaluator.summarize(values, labels, rows)
+        scores = {'silhouette': silhouette['score'],
+                  'silhouette_low': silhouette['low'],
+                  'silhouette_high': silhouette['high'],
+                  'calinski_harabasz': calinski_harabasz_score(X, labels),
+                  'davies_bouldin': davies_bouldin_score(X, labels)}
+        return scores, (values, labels[rows]), time.perf_counter() - start
+
+
+class ModelSweep:
+    # KMeans fits of every k in k_values with every init seed in seeds (each fit runs params['n_init'] inits,
+    # the default is one task per k with the seed of KMEANS_PARAMS). n_jobs is the number of worker
+    # processes (None or -1: all cores). After fit:
+    #   models_             {k: the fit of k with the lowest inertia}
+    #   fits_               one row per (k, seed): inertia, iterations and wall time of the fit
+    #   scores_             one row per k: inertia, silhouette with its interval (see SilhouetteEvaluator),
+    #                       Calinski-Harabasz and Davies-Bouldin of the best fit, and the wall times
+    #   silhouette_samples_ {k: (silhouette values, labels)} of the evaluated samples, for the silhouette plots
+
+    def __init__(self, k_values, seeds=None, n_jobs=None, evaluator=None, **params):
+        self.k_values = list(k_values)
+        self.params = {**KMEANS_PARAMS, **params}
+        self.seeds = [self.params['random_state']] if seeds is None else list(seeds)
+        self.n_jobs = n_jobs
+        self.evaluator = evaluator or SilhouetteEvaluator()
+
+    def fit(self, X):
+        columns = getattr(X, 'columns', None)
+        X = np.ascontiguousarray(X, dtype=np.float64)
+        tasks = [(k, seed) for k in self.k_values for seed in self.seeds]
+
+        # max_nbytes=0 memory-maps X for every task, whatever its size; both stages share the same workers
+        n_jobs = -1 if self.n_jobs is None else self.n_jobs
+        with Parallel(n_jobs=n_jobs, max_nbytes=0, mmap_mode='r') as parallel:
+            fits = parallel(delayed(_fit_task)(X, k, seed, self.params) for k, seed in tasks)
+
+            self.fits_ = pd.DataFrame([{'k': k, 'seed': seed, 'inertia': model.inertia_,
+                                        'iterations': model.n_iter_, 'fit_seconds': seconds}
+                                       for (k, seed), (model, seconds) in zip(tasks, fits)])
+            best = self.fits_.groupby('k', sort=False)['inertia'].idxmin()
+            self.models_ = {k: fits[best[k]][0] for k in self.k_values}
+            # The workers only see the array, the models check the feature names of a DataFrame as if they
+            # had been fitted on it
+            if columns is not None:
+                for model in self.models_.values():
+                    model.feature_names_in_ = np.asarray(columns, dtype=object)
+
+            scored = parallel(delayed(_score_task)(X, self.models_[k].labels_, self.evaluator)
+                              for k in self.k_values)
+
+        scores = pd.DataFrame([scores for scores, _, _ in scored], index=pd.Index(self.k_values, name='k'))
+        scores.insert(0, 'inertia', [self.models_[k].inertia_ for k in self.k_values])
+        scores['fit_seconds'] = self.fits_.groupby('k')['fit_seconds'].sum()
+        scores['score_seconds'] = [seconds for _, _, seconds in scored]
+        self.scores_ = scores
+        self.silhouette_samples_ = {k: samples for k, (_, samples, _) in zip(self.k_values, scored)}
+        return self
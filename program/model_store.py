@@ -0,0 +1,121 @@
+import hashlib
+import json
+import os
+import time
+
+import joblib
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+import sklearn
+
+
+# Store of fitted models (scaler, PCA, outlier detector, KMeans, neighbour index, ...).
+# Every model is saved under a name as a numbered version: models/<name>/v<version>.joblib plus a
+# v<version>.json with the feature schema it was trained on, a fingerprint of the training data, its
+# parameters and the scikit-learn version. Saving the same model on the same data again does not add a version.
+# Loading checks the schema, so a model is never applied to columns it was not trained on.
+
+MODEL_DIR = 'models'
+
+
+# sha256 of the training data: values, shape and, for data frames, the column names and index
+def data_fingerprint(data):
+    digest = hashlib.sha256()
+    if isinstance(data, (pd.DataFrame, pd.Series)):
+        columns = data.columns if isinstance(data, pd.DataFrame) else [data.name]
+        digest.update(json.dumps([str(column) for column in columns]).encode())
+        digest.update(pd.util.hash_pandas_object(data, index=True).to_numpy().tobytes())
+    elif sp.issparse(data):
+        data = data.tocsr()
+        digest.update(str(data.shape).encode())
+        for array in (data.data, data.indices, data.indptr):
+            digest.update(np.ascontiguousarray(array).tobytes())
+    else:
+        data = np.ascontiguousarray(data)
+        digest.update(f'{data.shape}{data.dtype}'.encode())
+        digest.update(data.tobytes())
+    return digest.hexdigest()
+
+
+# Constructor parameters of an estimator as strings, so that refits with other settings get a new version
+def _params(model):
+    if not hasattr(model, 'get_params'):
+        return {}
+    return {key: repr(value) for key, value in sorted(model.get_params(deep=False).items())}
+
+
+def _versions(name, model_dir):
+    directory = os.path.join(model_dir, name)
+    if not os.path.isdir(directory):
+        return []
+    return sorted(int(file[1:-5]) for file in os.listdir(directory)
+                  if file.startswith('v') and file.endswith('.json'))
+
+
+def _paths(name, version, model_dir):
+    base = os.path.join(model_dir, name, f'v{version}')
+    return base + '.joblib', base + '.json'
+
+
+# Metadata of the latest version of name, or None if it was never saved
+def latest_metadata(name, model_dir=MODEL_DIR):
+    versions = _versions(name, model_dir)
+    if not versions:
+        return None
+    with open(_paths(name, versions[-1], model_dir)[1], 'r') as file:
+        return json.load(file)
+
+
+# Saves model as a new version of name and returns its metadata.
+# schema is the list of feature names the model takes; extra is stored with the metadata (JSON types only).
+def save_artifact(model, name, schema, fingerprint, extra=None, model_dir=MODEL_DIR):
+    latest = latest_metadata(name, model_dir)
+    extra = extra or {}
+    params = _params(model)
+    if latest is not None and latest['schema'] == list(schema) and latest['fingerprint'] == fingerprint \
+            and latest['params'] == params and latest['extra'] == extra:
+        return latest
+
+    version = 1 if latest is None else latest['version'] + 1
+    model_path, metadata_path = _paths(name, version, model_dir)
+    os.makedirs(os.path.dirname(model_path), exist_ok=True)
+
+    metadata = {
+        'name': name,
+        'version': version,
+        'schema': list(schema),
+        'fingerprint': fingerprint,
+        'params': params,
+        'sklearn_version': sklearn.__version__,
+        'created': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'extra': extra,
+    }
+    joblib.dump(model, model_path)
+    # The metadata is written last, so an interrupted save never shows up as a version
+    with open(metadata_path, 'w') as file:
+        json.dump(metadata, file, indent=2)
+    return metadata
+
+
+# The model saved under name (the latest version unless one is given) and its metadata.
+# With schema the saved feature names must match it exactly.
+def load_artifact(name, schema=None, version=None, model_dir=MODEL_DIR):
+    if version is None:
+        versions = _versions(name, model_dir)
+        if not versions:
+            raise FileNotFoundError(f"No saved model named '{name}' in {os.path.abspath(model_dir)}")
+        version = versions[-1]
+
+    model_path, metadata_path = _paths(name, version, model_dir)
+    with open(metadata_path, 'r') as file:
+        metadata = json.load(file)
+
+    if schema is not None and metadata['schema'] != list(schema):
+        raise ValueError(f"Model '{name}' v{version} was trained on features {metadata['schema']}, "
+                         f"got {list(schema)}")
+    if metadata['sklearn_version'] != sklearn.__version__:
+        print(f"Model '{name}' v{version} was saved with scikit-learn {metadata['sklearn_version']}, "
+              f"running {sklearn.__version__}.")
+
+    return joblib.load(model_path), metadata
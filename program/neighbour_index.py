@@ -0,0 +1,401 @@
+import time
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+
+# Neighbour search over the sparse customer-product matrix.
+# Every index has the same fit / kneighbors interface as sklearn's NearestNeighbors, so
+# get_recommendations does not need to know which backend is behind it.
+
+METRICS = ('euclidean', 'cosine', 'jaccard')
+
+# Upper bound on the number of cells in one dense (queries x customers) distance block
+MAX_BLOCK_CELLS = 2 ** 25
+
+
+def _as_csr(X):
+    X = sparse.csr_matrix(X, dtype=np.float64)
+    X.sum_duplicates()
+    return X
+
+
+def _prepare(X, metric):
+    X = _as_csr(X)
+    if metric == 'jaccard':
+        # Jaccard works on purchased / not purchased sets
+        X = (X > 0).astype(np.float64)
+    return X
+
+
+def _row_stats(X, metric):
+    if metric == 'euclidean':
+        return np.asarray(X.multiply(X).sum(axis=1)).ravel()
+    if metric == 'cosine':
+        return np.sqrt(np.asarray(X.multiply(X).sum(axis=1)).ravel())
+    # jaccard: number of purchased products per row
+    return np.diff(X.indptr).astype(np.float64)
+
+
+# Distances from dot products and the row statistics of both sides (broadcast against each other)
+def _distances(products, q_stats, x_stats, metric):
+    if metric == 'euclidean':
+        distances = q_stats + x_stats - 2 * products
+        np.maximum(distances, 0, out=distances)
+        return np.sqrt(distances, out=distances)
+
+    if metric == 'cosine':
+        norms = q_stats * x_stats
+        with np.errstate(divide='ignore', invalid='ignore'):
+            similarity = np.where(norms > 0, products / norms, 0.0)
+        return 1 - similarity
+
+    union = q_stats + x_stats - products
+    with np.errstate(divide='ignore', invalid='ignore'):
+        similarity = np.where(union > 0, products / union, 1.0)
+    return 1 - similarity
+
+
+# Distances between a block of query rows and a set of indexed rows, computed from one
+# sparse matrix product. Returns a dense (len(Q) x len(X)) array.
+def pairwise_distances_block(Q, q_stats, X, x_stats, metric):
+    products = (Q @ X.T).toarray()
+    return _distances(products, q_stats[:, None], x_stats[None, :], metric)
+
+
+# Distances of the (query, row) pairs given by two index arrays, Q[queries[i]] to X[rows[i]]
+def paired_distances(Q, q_stats, X, x_stats, queries, rows, metric):
+    products = np.asarray(Q[queries].multiply(X[rows]).sum(axis=1)).ravel()
+    return _distances(products, q_stats[queries], x_stats[rows], metric)
+
+
+# k smallest distances of every row, sorted, ties broken by column position: of the columns tied with the
+# k-th distance, the first ones are kept (argpartition alone would keep any of them)
+def _top_k(distances, k, columns=None):
+    k = min(k, distances.shape[1])
+    if k < distances.shape[1]:
+        kth_distance = np.partition(distances, k - 1, axis=1)[:, k - 1, None]
+        below = distances < kth_distance
+        tied = distances == kth_distance
+        missing = k - below.sum(axis=1, keepdims=True)
+        chosen = below | (tied & (np.cumsum(tied, axis=1) <= missing))
+        # Exactly k cells per row, in column order
+        candidates = np.nonzero(chosen)[1].reshape(len(distances), k)
+    else:
+        candidates = np.broadcast_to(np.arange(distances.shape[1]), distances.shape)
+    candidate_distances = np.take_along_axis(distances, candidates, axis=1)
+    order = np.argsort(candidate_distances, axis=1, kind='stable')
+
+    indices = np.take_along_axis(candidates, order, axis=1)
+    top_distances = np.take_along_axis(candidate_distances, order, axis=1)
+    if columns is not None:
+        indices = columns[indices]
+    return top_distances, indices
+
+
+# Best n_neighbors of a batch of n_queries queries from (query, row, distance) candidate triples without
+# duplicate pairs, ties broken by row position. Missing neighbours are left at distance inf. Also returns
+# the number of candidates of every query.
+def _merge_candidates(queries, rows, distances, n_queries, n_neighbors):
+    order = np.lexsort((rows, distances, queries))
+    queries, rows, distances = queries[order], rows[order], distances[order]
+    counts = np.bincount(queries, minlength=n_queries)
+    rank = np.arange(len(queries)) - np.repeat(np.cumsum(counts) - counts, counts)
+    keep = rank < n_neighbors
+
+    top_distances = np.full((n_queries, n_neighbors), np.inf)
+    top_indices = np.zeros((n_queries, n_neighbors), dtype=np.intp)
+    top_distances[queries[keep], rank[keep]] = distances[keep]
+    top_indices[queries[keep], rank[keep]] = rows[keep]
+    return top_distances, top_indices, counts
+
+
+class BruteForceIndex:
+    # Exact search: distances to every indexed row, computed in batches of queries
+
+    def __init__(self, metric='euclidean', n_neighbors=5, batch_size=None):
+        if metric not in METRICS:
+            raise ValueError(f"Unknown metric '{metric}', expected one of {METRICS}")
+        self.metric = metric
+        self.n_neighbors = n_neighbors
+        self.batch_size = batch_size
+
+    def fit(self, X):
+        self._X = _prepare(X, self.metric)
+        self._stats = _row_stats(self._X, self.metric)
+        return self
+
+    def _batch_size(self):
+        if self.batch_size is not None:
+            return self.batch_size
+        return max(1, MAX_BLOCK_CELLS // max(1, self._X.shape[0]))
+
+    def kneighbors(self, X=None, n_neighbors=None):
+        n_neighbors = n_neighbors or self.n_neighbors
+        Q = self._X if X is None else _prepare(X, self.metric)
+        q_stats = self._stats if X is None else _row_stats(Q, self.metric)
+
+        batch_size = self._batch_size()
+        all_distances, all_indices = [], []
+        for start in range(0, Q.shape[0], batch_size):
+            stop = start + batch_size
+            block = pairwise_distances_block(Q[start:stop], q_stats[start:stop], self._X, self._stats, self.metric)
+            distances, indices = _top_k(block, n_neighbors)
+            all_distances.append(distances)
+            all_indices.append(indices)
+
+        return np.vstack(all_distances), np.vstack(all_indices)
+
+
+class LSHIndex:
+    # Approximate search with random-projection (sign) hashing.
+    # Each of the n_tables tables hashes a row to n_bits signs of random projections; rows that
+    # share a bucket with the query in any table become candidates and are then ranked with the exact
+    # metric. Queries are processed batch_size at a time: the candidates of a whole batch are gathered as
+    # (query, row) pairs and their distances come out of one sparse row-wise product.
+    # Sign hashes only collide often for rows at a small angle, so on very sparse purchase matrices, where
+    # even the nearest neighbours share only a few products, the recall stays low (about 0.2 with the
+    # defaults on a 20000 x 3000 matrix, at 10x+ the speed of exact search) and more tables or fewer bits
+    # cost more than an exact scan before it improves much. IVFIndex is the better trade-off there; check
+    # both on your own matrix with recall_report.
+
+    def __init__(self, metric='cosine', n_neighbors=5, n_tables=8, n_bits=12, batch_size=1024, random_state=0):
+        if metric not in METRICS:
+            raise ValueError(f"Unknown metric '{metric}', expected one of {METRICS}")
+        if not 0 < n_bits < 64:
+            raise ValueError("n_bits must be between 1 and 63")
+        self.metric = metric
+        self.n_neighbors = n_neighbors
+        self.n_tables = n_tables
+        self.n_bits = n_bits
+        self.batch_size = batch_size
+        self.random_state = random_state
+
+    def _hash(self, X):
+        projected = np.asarray(X @ self._planes)
+        bits = (projected > 0).reshape(X.shape[0], self.n_tables, self.n_bits)
+        return bits.astype(np.uint64) @ self._powers
+
+    def fit(self, X):
+        self._X = _prepare(X, self.metric)
+        self._stats = _row_stats(self._X, self.metric)
+
+        rng = np.random.default_rng(self.random_state)
+        self._planes = rng.standard_normal((self._X.shape[1], self.n_tables * self.n_bits))
+        self._powers = (2 ** np.arange(self.n_bits, dtype=np.uint64)).astype(np.uint64)
+
+        # One sorted code array per table, so a bucket is a searchsorted range
+        codes = self._hash(self._X)
+        self._order = np.argsort(codes, axis=0, kind='stable')
+        self._sorted_codes = np.take_along_axis(codes, self._order, axis=0)
+        return self
+
+    # Distinct (query, row) candidate pairs of a batch of query codes, sorted by query then row
+    def _candidates(self, codes):
+        n_rows = self._X.shape[0]
+        keys = []
+        for table in range(self.n_tables):
+            lo = np.searchsorted(self._sorted_codes[:, table], codes[:, table], side='left')
+            hi = np.searchsorted(self._sorted_codes[:, table], codes[:, table], side='right')
+            counts = hi - lo
+            queries = np.repeat(np.arange(len(codes)), counts)
+            positions = np.repeat(lo - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+            keys.append(queries * n_rows + self._order[positions, table])
+        keys = np.unique(np.concatenate(keys))
+        return keys // n_rows, keys % n_rows
+
+    def kneighbors(self, X=None, n_neighbors=None):
+        n_neighbors = n_neighbors or self.n_neighbors
+        Q = self._X if X is None else _prepare(X, self.metric)
+        q_stats = self._stats if X is None else _row_stats(Q, self.metric)
+        codes = self._hash(Q)
+
+        return _approximate_search(self, Q, q_stats, n_neighbors,
+                                   lambda start, stop: self._candidates(codes[start:stop]))
+
+
+class IVFIndex:
+    # Approximate search with an inverted file: the rows are split into n_lists clusters (a few spherical
+    # k-means iterations on the direction of every row, i.e. on which products a customer buys rather than
+    # how many), and a query is only compared with the rows of the n_probe clusters closest to it. The
+    # queries of a batch that probe the same cluster are compared with its rows in one sparse matrix
+    # product, so the cost is about n_probe / n_lists of an exact scan. n_lists defaults to the square
+    # root of the number of rows. Unlike LSH it keeps a useful recall on very sparse matrices, where
+    # neighbours share only a few products; raise n_probe for recall, lower it for speed.
+
+    def __init__(self, metric='cosine', n_neighbors=5, n_lists=None, n_probe=8, n_iter=10, batch_size=1024,
+                 random_state=0):
+        if metric not in METRICS:
+            raise ValueError(f"Unknown metric '{metric}', expected one of {METRICS}")
+        self.metric = metric
+        self.n_neighbors = n_neighbors
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.n_iter = n_iter
+        self.batch_size = batch_size
+        self.random_state = random_state
+
+    @staticmethod
+    def _directions(X):
+        norms = np.sqrt(np.asarray(X.multiply(X).sum(axis=1)).ravel())
+        norms[norms == 0] = 1
+        return sparse.csr_matrix(X.multiply(1 / norms[:, None]))
+
+    # The n closest clusters of every row, by cosine similarity to the centroids
+    def _closest(self, directions, n):
+        scores = np.asarray(directions @ self._centroids.T)
+        if n >= scores.shape[1]:
+            return np.broadcast_to(np.arange(scores.shape[1]), scores.shape)
+        return np.argpartition(-scores, n - 1, axis=1)[:, :n]
+
+    def fit(self, X):
+        self._X = _prepare(X, self.metric)
+        self._stats = _row_stats(self._X, self.metric)
+        n_rows = self._X.shape[0]
+        n_lists = min(n_rows, self.n_lists or max(1, int(np.sqrt(n_rows))))
+
+        directions = self._directions(self._X)
+        rng = np.random.default_rng(self.random_state)
+        self._centroids = directions[rng.choice(n_rows, size=n_lists, replace=False)].toarray()
+        for _ in range(self.n_iter):
+            assignment = self._closest(directions, 1)[:, 0]
+            members = sparse.csr_matrix((np.ones(n_rows), (assignment, np.arange(n_rows))),
+                                        shape=(n_lists, n_rows))
+            sums = (members @ directions).toarray()
+            # Empty clusters keep their centroid
+            norms = np.linalg.norm(sums, axis=1)
+            filled = norms > 0
+            self._centroids[filled] = sums[filled] / norms[filled, None]
+        assignment = self._closest(directions, 1)[:, 0]
+
+        # The rows of every cluster are one range of _order
+        self._order = np.argsort(assignment, kind='stable')
+        self._starts = np.concatenate([[0], np.cumsum(np.bincount(assignment, minlength=n_lists))])
+        return self
+
+    # (query, row, distance) of the rows in the probed clusters of a batch of queries
+    def _candidates(self, Q, q_stats, n_neighbors):
+        probes = self._closest(self._directions(Q), min(self.n_probe, len(self._centroids)))
+        probe_queries = np.repeat(np.arange(Q.shape[0]), probes.shape[1])
+        probe_lists = probes.ravel()
+        order = np.argsort(probe_lists, kind='stable')
+        probe_queries, probe_lists = probe_queries[order], probe_lists[order]
+        bounds = np.flatnonzero(np.diff(probe_lists)) + 1
+
+        queries, rows, distances = [], [], []
+        for group in np.split(np.arange(len(probe_lists)), bounds):
+            cluster = probe_lists[group[0]]
+            members = self._order[self._starts[cluster]:self._starts[cluster + 1]]
+            if len(members) == 0:
+                continue
+            group_queries = probe_queries[group]
+            block = pairwise_distances_block(Q[group_queries], q_stats[group_queries], self._X[members],
+                                             self._stats[members], self.metric)
+            top_distances, top_rows = _top_k(block, n_neighbors, columns=members)
+            queries.append(np.repeat(group_queries, top_rows.shape[1]))
+            rows.append(top_rows.ravel())
+            distances.append(top_distances.ravel())
+        if not queries:
+            return np.zeros(0, dtype=np.intp), np.zeros(0, dtype=np.intp), np.zeros(0)
+        return np.concatenate(queries), np.concatenate(rows), np.concatenate(distances)
+
+    def kneighbors(self, X=None, n_neighbors=None):
+        n_neighbors = n_neighbors or self.n_neighbors
+        Q = self._X if X is None else _prepare(X, self.metric)
+        q_stats = self._stats if X is None else _row_stats(Q, self.metric)
+        return _approximate_search(self, Q, q_stats, n_neighbors,
+                                   lambda start, stop: self._candidates(Q[start:stop], q_stats[start:stop], n_neighbors),
+                                   with_distances=True)
+
+
+# Batched search of an approximate index: candidates(start, stop) gives the candidates of queries
+# start..stop, as (query, row) pairs, or as (query, row, distance) triples with with_distances. Queries
+# with fewer candidates than n_neighbors get an exact scan, together as one block.
+def _approximate_search(index, Q, q_stats, n_neighbors, candidates, with_distances=False):
+    all_distances = np.full((Q.shape[0], n_neighbors), np.inf)
+    all_indices = np.zeros((Q.shape[0], n_neighbors), dtype=np.intp)
+    for start in range(0, Q.shape[0], index.batch_size):
+        stop = min(start + index.batch_size, Q.shape[0])
+        if with_distances:
+            queries, rows, distances = candidates(start, stop)
+        else:
+            queries, rows = candidates(start, stop)
+            distances = paired_distances(Q[start:stop], q_stats[start:stop], index._X, index._stats,
+                                         queries, rows, index.metric)
+        top_distances, top_indices, counts = _merge_candidates(queries, rows, distances, stop - start, n_neighbors)
+        all_distances[start:stop] = top_distances
+        all_indices[start:stop] = top_indices
+
+        short = np.flatnonzero(counts < min(n_neighbors, index._X.shape[0])) + start
+        if len(short):
+            block = pairwise_distances_block(Q[short], q_stats[short], index._X, index._stats, index.metric)
+            distances, indices = _top_k(block, n_neighbors)
+            all_distances[short, :distances.shape[1]] = distances
+            all_indices[short, :indices.shape[1]] = indices
+
+    return all_distances, all_indices
+
+
+BACKENDS = {
+    'brute': BruteForceIndex,
+    'lsh': LSHIndex,
+    'ivf': IVFIndex,
+}
+
+
+def build_index(backend='brute', metric='euclidean', n_neighbors=5, **options):
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown neighbour backend '{backend}', expected one of {list(BACKENDS)}")
+    return BACKENDS[backend](metric=metric, n_neighbors=n_neighbors, **options)
+
+
+# Recall of each index configuration against exact brute-force search on a sample of customers.
+# A returned neighbour counts as correct when its true distance is within the exact k-th distance, so
+# an index that returns another row tied with the k-th neighbour (an approximate index may not see the
+# row exact search keeps) is not counted as missing it.
+def recall_report(X, configurations, metric='euclidean', n_neighbors=5, sample_size=1000, random_state=0):
+    X = _as_csr(X)
+    rng = np.random.default_rng(random_state)
+    sample = np.sort(rng.choice(X.shape[0], size=min(sample_size, X.shape[0]), replace=False))
+    queries = X[sample]
+
+    exact = BruteForceIndex(metric=metric, n_neighbors=n_neighbors)
+    start = time.perf_counter()
+    exact.fit(X)
+    exact_fit = time.perf_counter() - start
+    start = time.perf_counter()
+    exact_distances, _ = exact.kneighbors(queries)
+    exact_query = time.perf_counter() - start
+    kth_distance = exact_distances[:, -1]
+
+    rows = [{'backend': 'brute', 'options': '', 'recall': 1.0,
+             'fit_seconds': exact_fit, 'query_seconds': exact_query, 'speedup': 1.0}]
+
+    exact_queries = _prepare(queries, metric)
+    query_stats = _row_stats(exact_queries, metric)
+    for options in configurations:
+        options = dict(options)
+        backend = options.pop('backend', 'lsh')
+        index = build_index(backend, metric=metric, n_neighbors=n_neighbors, **options)
+
+        start = time.perf_counter()
+        index.fit(X)
+        fit_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        _, indices = index.kneighbors(queries)
+        query_seconds = time.perf_counter() - start
+
+        pair_queries = np.repeat(np.arange(len(sample)), indices.shape[1])
+        true_distances = paired_distances(exact_queries, query_stats, exact._X, exact._stats,
+                                          pair_queries, indices.ravel(), metric)
+        hits = np.count_nonzero(true_distances <= kth_distance[pair_queries] + 1e-9)
+
+        rows.append({'backend': backend,
+                     'options': ', '.join(f'{key}={value}' for key, value in options.items()),
+                     'recall': hits / (len(sample) * n_neighbors),
+                     'fit_seconds': fit_seconds,
+                     'query_seconds': query_seconds,
+                     'speedup': exact_query / query_seconds if query_seconds > 0 else np.inf})
+
+    return pd.DataFrame(rows)
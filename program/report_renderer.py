@@ -0,0 +1,105 @@
+import hashlib
+import os
+import pickle
+import shutil
+
+import numpy as np
+
+
+# Deferred rendering of the kmeans_alg.py charts.
+# The pipeline only saves the small data behind every chart (save_chart_data). An image is drawn when
+# someone asks for it (render_chart), and is cached under the hash of its data, so a chart is only
+# redrawn when its data changed. Importing this module does not import any plotting library.
+
+REPORT_DIR = 'report'
+
+# Bump when the drawing code in kmeans_plots.py changes, so the cached images are redrawn
+RENDER_VERSION = 1
+
+# chart name: (kmeans_plots function, image file name)
+CHARTS = {
+    'missing_values': ('plotMissingValues', 'percentage_of_missing_values.jpg'),
+    'top_stock_codes': ('plotTopStockCodes', 'top_10_stock_codes.jpg'),
+    'top_descriptions': ('plotTopDescriptions', 'number_of_occurrences.jpg'),
+    'outliers': ('plotOutliers', 'inliners_and_outliners.jpg'),
+    'correlation_matrix': ('plotCorrelationMatrix', 'correlation_matrix.jpg'),
+    'explained_variance': ('plotExplainedVariance', 'CV_vs_NoC.jpg'),
+    'elbow': ('plotElbow', 'elbow.jpg'),
+    'silhouette_scores': ('plotSilhouetteScores', 'avg_silhouette_scores.jpg'),
+    'silhouette_plots': ('silhouettePlots', 'avg_silhouette_scot_for_k.jpg'),
+    'clusters_3d': ('plotClusters3d', '3d_visualization.html'),
+    'cluster_distribution': ('plotClusterDistribution', 'dist_of_customers_across_clusters.jpg'),
+    'cluster_radar': ('plotRadarCharts', 'cluster_radar_charts.jpg'),
+    'feature_histograms': ('plotFeatureHistograms', 'cluster_feature_histograms.jpg'),
+}
+
+# Charts whose images kmeans_alg.py has always written next to itself, under the names of CHARTS; the GUI
+# and the readme use these files
+LEGACY_CHARTS = ('missing_values', 'top_stock_codes', 'top_descriptions', 'outliers', 'correlation_matrix',
+                 'explained_variance', 'silhouette_plots', 'clusters_3d', 'cluster_distribution')
+
+
+def _data_path(name, report_dir):
+    return os.path.join(report_dir, 'data', name + '.pkl')
+
+
+# Saves the arguments of the chart's kmeans_plots function (without path)
+def save_chart_data(name, report_dir=REPORT_DIR, **data):
+    if name not in CHARTS:
+        raise ValueError(f"Unknown chart '{name}', expected one of {tuple(CHARTS)}")
+    os.makedirs(os.path.join(report_dir, 'data'), exist_ok=True)
+    with open(_data_path(name, report_dir), 'wb') as file:
+        pickle.dump(data, file, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def load_chart_data(name, report_dir=REPORT_DIR):
+    with open(_data_path(name, report_dir), 'rb') as file:
+        return pickle.load(file)
+
+
+# Names of the charts whose data has been saved
+def available_charts(report_dir=REPORT_DIR):
+    return [name for name in CHARTS if os.path.exists(_data_path(name, report_dir))]
+
+
+# Per-cluster histogram counts of every feature, the data of the feature histograms:
+# {(feature, cluster): (counts, bin edges)}
+def histogram_table(customer_data, features, bins=20):
+    histograms = {}
+    for feature in features:
+        for cluster, values in customer_data.groupby('cluster')[feature]:
+            histograms[(feature, cluster)] = np.histogram(values.to_numpy(dtype=np.float64), bins=bins)
+    return histograms
+
+
+# Path of the chart's image, drawn only if no image of the same data is cached.
+# With copy_to the image is also copied there (e.g. the file name kmeans_alg.py used to write).
+def render_chart(name, report_dir=REPORT_DIR, copy_to=None):
+    function, file_name = CHARTS[name]
+    with open(_data_path(name, report_dir), 'rb') as file:
+        raw = file.read()
+    digest = hashlib.sha256(raw + f'{name}:{RENDER_VERSION}'.encode()).hexdigest()[:16]
+
+    stem, extension = os.path.splitext(file_name)
+    path = os.path.join(report_dir, 'images', f'{stem}-{digest}{extension}')
+    if not os.path.exists(path):
+        import matplotlib.pyplot as plt
+        import kmeans_plots
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Drawn to a temporary name, so an interrupted render never looks cached
+        temporary = path + '.tmp' + extension
+        getattr(kmeans_plots, function)(**pickle.loads(raw), path=temporary)
+        plt.close('all')
+        os.replace(temporary, path)
+
+    if copy_to is not None:
+        shutil.copyfile(path, os.path.join(copy_to, file_name))
+    return path
+
+
+# Every chart with saved data. With copy_to only the LEGACY_CHARTS images are copied there, the newer
+# charts stay in the report directory.
+def render_all(report_dir=REPORT_DIR, copy_to=None):
+    return {name: render_chart(name, report_dir, copy_to if name in LEGACY_CHARTS else None)
+            for name in available_charts(report_dir)}
@@ -0,0 +1,144 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+
+# Result store shared by knn_alg.py, kmeans_alg.py, comparison.py and final_gui.py.
+# Every stage writes its result table under a name (e.g. 'knn_customer_recommendations') in a binary
+# columnar format, and the next stage reads it back by the same name. Excel is only written as an
+# optional report next to it, since openpyxl is very slow for large tables.
+# A result can also be updated with patches (see write_patch): only the changed rows are written, and
+# read_results applies the patches on top of the last full result in the order they were written.
+
+RESULT_DIR = '.'
+
+# Interchange format of the stages; the reader finds whichever format a result was stored in
+DEFAULT_FORMAT = 'parquet'
+
+
+def _write_parquet(df, path):
+    df.to_parquet(path, index=False)
+
+
+def _write_feather(df, path):
+    df.reset_index(drop=True).to_feather(path)
+
+
+def _write_excel(df, path):
+    df.to_excel(path, index=False)
+
+
+# format: (file extension, writer, reader)
+FORMATS = {
+    'parquet': ('.parquet', _write_parquet, pd.read_parquet),
+    'feather': ('.feather', _write_feather, pd.read_feather),
+    'excel': ('.xlsx', _write_excel, pd.read_excel),
+}
+
+# Order in which read_results looks for a stored result
+READ_ORDER = ('parquet', 'feather', 'excel')
+
+# Marks the keys a patch removes from the result
+DELETED_COLUMN = '_deleted'
+
+
+def _has_pyarrow():
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def result_path(name, format=DEFAULT_FORMAT, result_dir=RESULT_DIR):
+    if format not in FORMATS:
+        raise ValueError(f"Unknown result format '{format}', expected one of {tuple(FORMATS)}")
+    return os.path.join(result_dir, name + FORMATS[format][0])
+
+
+# Stores df under name and returns the path written.
+# With excel_report the table is also exported to name.xlsx for people who want to open it by hand.
+def write_results(df, name, format=DEFAULT_FORMAT, excel_report=False, result_dir=RESULT_DIR):
+    if format != 'excel' and not _has_pyarrow():
+        print(f"pyarrow is not installed, {name} is stored as Excel.")
+        format = 'excel'
+
+    path = result_path(name, format, result_dir)
+    FORMATS[format][1](df, path)
+    # A copy in another format would be read instead of this one
+    for other in READ_ORDER[:READ_ORDER.index(format)]:
+        other_path = result_path(name, other, result_dir)
+        if os.path.exists(other_path):
+            os.remove(other_path)
+    if excel_report and format != 'excel':
+        _write_excel(df, result_path(name, 'excel', result_dir))
+    # A full result replaces the patches of the previous one
+    for _, patch, _ in _patches(name, result_dir):
+        os.remove(patch)
+    return path
+
+
+# (number, path, format) of the patch files of name, oldest first
+def _patches(name, result_dir=RESULT_DIR):
+    extensions = {extension: format for format, (extension, _, _) in FORMATS.items()}
+    patches = []
+    for file in os.listdir(result_dir):
+        number, _, extension = file[len(name + '.patch'):].partition('.')
+        if file.startswith(name + '.patch') and number.isdigit() and '.' + extension in extensions:
+            patches.append((int(number), os.path.join(result_dir, file), extensions['.' + extension]))
+    return sorted(patches)
+
+
+# Stores the rows of patch as an update of the result stored under name: rows whose key is already in
+# the result replace it, the others are added, and the keys in deleted are removed.
+def write_patch(patch, name, key='CustomerID', deleted=(), format=DEFAULT_FORMAT, result_dir=RESULT_DIR):
+    if format != 'excel' and not _has_pyarrow():
+        format = 'excel'
+
+    # The deletion markers repeat the first row of the patch under the deleted keys, so every column keeps
+    # its dtype in the patch file (an int column with missing values would be stored as float)
+    if len(patch):
+        filler = patch.iloc[np.zeros(len(deleted), dtype=np.int64)]
+    else:
+        filler = patch.reindex(range(len(deleted)))
+    removed = filler.assign(**{key: np.asarray(deleted, dtype=patch[key].dtype)})
+    patch = pd.concat([patch.assign(**{DELETED_COLUMN: False}), removed.assign(**{DELETED_COLUMN: True})],
+                      ignore_index=True)
+
+    patches = _patches(name, result_dir)
+    number = patches[-1][0] + 1 if patches else 1
+    path = os.path.join(result_dir, f'{name}.patch{number}' + FORMATS[format][0])
+    FORMATS[format][1](patch, path)
+    return path
+
+
+# Updated rows stay where they were, new rows are added at the end
+def apply_patch(results, patch, key='CustomerID'):
+    deleted = patch[DELETED_COLUMN].astype(bool)
+    rows = patch[~deleted].drop(columns=DELETED_COLUMN)
+    # A patch of deletions only (or one written before the markers kept the dtypes) can have float columns
+    # where the result has int ones, the updated rows take the dtypes of the result
+    rows = rows.astype({column: results[column].dtype for column in rows.columns if column in results})
+
+    position = pd.Series(np.arange(len(results)), index=results[key]).groupby(level=0).first()
+    kept = results[~results[key].isin(patch[key])]
+    row_position = position.reindex(rows[key]).to_numpy()
+    row_position = np.where(np.isnan(row_position), len(results) + np.arange(len(rows)), row_position)
+
+    combined = pd.concat([kept, rows], ignore_index=True)
+    order = np.argsort(np.concatenate([position.reindex(kept[key]).to_numpy(), row_position]), kind='stable')
+    return combined.iloc[order].reset_index(drop=True)
+
+
+# The result stored under name, from the first format in READ_ORDER that exists, with its patches applied
+def read_results(name, key='CustomerID', result_dir=RESULT_DIR):
+    formats = READ_ORDER if _has_pyarrow() else ('excel',)
+    for format in formats:
+        path = result_path(name, format, result_dir)
+        if os.path.exists(path):
+            results = FORMATS[format][2](path)
+            for _, patch, patch_format in _patches(name, result_dir):
+                results = apply_patch(results, FORMATS[patch_format][2](patch), key)
+            return results
+    raise FileNotFoundError(f"No stored result named '{name}' in {os.path.abspath(result_dir)}")
@@ -0,0 +1,128 @@
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+
+# Silhouette evaluation without the n x n distance matrix.
+# 'exact' computes the silhouette of every sample, a block of samples at a time: each block's distances
+# to all samples are reduced to per-cluster sums straight away, so memory is one (block x n) array.
+# 'sampled' computes the exact silhouette of a stratified sample (the same share of every cluster) and
+# estimates the average with a confidence interval, so the cost is (sample x n) instead of (n x n).
+
+MODES = ('exact', 'sampled')
+
+# Cells of one block of distances
+MAX_BLOCK_CELLS = 2**24
+
+
+# Silhouette values of the samples in rows (all samples if None), against all samples of X.
+# Same conventions as sklearn's silhouette_samples: samples alone in their cluster get 0.
+def silhouette_values(X, labels, rows=None, block_size=None):
+    X = np.asarray(X, dtype=np.float64)
+    labels = np.asarray(labels)
+    rows = np.arange(len(X)) if rows is None else np.asarray(rows)
+
+    clusters, codes = np.unique(labels, return_inverse=True)
+    if len(clusters) < 2:
+        raise ValueError("The silhouette needs at least 2 clusters")
+
+    # Samples sorted by cluster, so the per-cluster distance sums are one reduceat per block
+    order = np.argsort(codes, kind='stable')
+    position = np.empty_like(order)
+    position[order] = np.arange(len(order))
+    sortedX = X[order]
+    sizes = np.bincount(codes, minlength=len(clusters))
+    starts = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+    squaredNorms = np.einsum('ij,ij->i', sortedX, sortedX)
+
+    if block_size is None:
+        block_size = max(1, MAX_BLOCK_CELLS // len(X))
+
+    values = np.empty(len(rows))
+    for start in range(0, len(rows), block_size):
+        block = rows[start:start + block_size]
+        blockRange = np.arange(len(block))
+        Q = X[block]
+        squared = np.einsum('ij,ij->i', Q, Q)[:, None] + squaredNorms[None, :] - 2 * Q @ sortedX.T
+        distances = np.sqrt(np.maximum(squared, 0))
+        # The distance of a sample to itself is only ~0 after the expansion above
+        distances[blockRange, position[block]] = 0
+        sums = np.add.reduceat(distances, starts, axis=1)
+
+        own = codes[block]
+        ownSize = sizes[own]
+        a = sums[blockRange, own] / np.maximum(ownSize - 1, 1)
+        means = sums / sizes[None, :]
+        means[blockRange, own] = np.inf
+        b = means.min(axis=1)
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            s = np.nan_to_num((b - a) / np.maximum(a, b))
+        values[start:start + len(block)] = np.where(ownSize > 1, s, 0.0)
+    return values
+
+
+# Rows of a stratified sample of about sample_size rows: every cluster gets its share of the sample,
+# and at least 2 rows (or all of them if it is smaller)
+def stratified_sample(labels, sample_size, random_state=0):
+    labels = np.asarray(labels)
+    rng = np.random.default_rng(random_state)
+    rows = []
+    for cluster in np.unique(labels):
+        members = np.flatnonzero(labels == cluster)
+        size = min(len(members), max(2, int(round(sample_size * len(members) / len(labels)))))
+        rows.append(np.sort(rng.choice(members, size=size, replace=False)))
+    return np.concatenate(rows)
+
+
+class SilhouetteEvaluator:
+    # Average silhouette score, exact or estimated from a stratified sample with a confidence interval
+
+    def __init__(self, mode='exact', sample_size=10_000, confidence=0.95, block_size=None, random_state=0):
+        if mode not in MODES:
+            raise ValueError(f"Unknown silhouette mode '{mode}', expected one of {MODES}")
+        self.mode = mode
+        self.sample_size = sample_size
+        self.confidence = confidence
+        self.block_size = block_size
+        self.random_state = random_state
+
+    # Rows that are evaluated: all of them, or a stratified sample
+    def rows(self, labels):
+        if self.mode == 'exact' or len(labels) <= self.sample_size:
+            return np.arange(len(labels))
+        return stratified_sample(labels, self.sample_size, self.random_state)
+
+    # Silhouette values of the evaluated rows, and the rows
+    def samples(self, X, labels):
+        rows = self.rows(labels)
+        return silhouette_values(X, labels, rows, self.block_size), rows
+
+    # Score with the bounds of its confidence interval (equal to the score when every row is evaluated)
+    # and the number of rows evaluated
+    def score(self, X, labels):
+        values, rows = self.samples(X, labels)
+        return self.summarize(values, np.asarray(labels), rows)
+
+    # Stratified estimate: the cluster means weighted by cluster size, with the standard error of
+    # sampling without replacement inside every cluster
+    def summarize(self, values, labels, rows):
+        n = len(labels)
+        if len(rows) == n:
+            score = values.mean()
+            return pd.Series({'score': score, 'low': score, 'high': score, 'evaluated': n})
+
+        sampleLabels = labels[rows]
+        score = 0.0
+        variance = 0.0
+        for cluster in np.unique(labels):
+            clusterValues = values[sampleLabels == cluster]
+            size = np.count_nonzero(labels == cluster)
+            weight = size / n
+            score += weight * clusterValues.mean()
+            if len(clusterValues) > 1:
+                variance += weight ** 2 * clusterValues.var(ddof=1) / len(clusterValues) * \
+                    (1 - len(clusterValues) / size)
+
+        margin = stats.norm.ppf(0.5 + self.confidence / 2) * np.sqrt(variance)
+        return pd.Series({'score': score, 'low': score - margin, 'high': score + margin, 'evaluated': len(rows)})
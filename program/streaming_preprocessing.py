@@ -0,0 +1,93 @@
+import os
+
+import numpy as np
+import pandas as pd
+from sklearn.decomposition import IncrementalPCA
+from sklearn.preprocessing import StandardScaler
+
+
+# Out-of-core scaling and PCA of the customer features (the customerData table of kmeans_alg.py).
+# The features are read a chunk at a time, from a parquet file on disk or from any source of data frame
+# chunks, in three passes: the scaler statistics (StandardScaler.partial_fit), the decomposition
+# (IncrementalPCA.partial_fit on the scaled chunks) and the projection, written chunk by chunk into a
+# memory-mapped float32 array. Memory is bounded by the chunk size; only the customer keys are kept whole.
+
+CHUNK_SIZE = 100_000
+
+
+def frame_chunks(df, chunk_size=CHUNK_SIZE):
+    for start in range(0, len(df), chunk_size):
+        yield df.iloc[start:start + chunk_size]
+
+
+# Needs pyarrow, which the in-memory path of kmeans_alg.py does not
+def parquet_chunks(file_path, chunk_size=CHUNK_SIZE, columns=None):
+    import pyarrow.parquet as pq
+
+    for batch in pq.ParquetFile(file_path).iter_batches(batch_size=chunk_size, columns=columns):
+        yield batch.to_pandas()
+
+
+class StreamingPreprocessor:
+    # chunks (in fit and transform) is a function returning a new iterator over the feature chunks, it is
+    # called once per pass and must give the same rows in the same order every time.
+    # The columns in scale_columns are standardised, the other feature columns are passed through as they
+    # are, like the in-memory path of kmeans_alg.py. After fit:
+    #   scaler_    the fitted StandardScaler
+    #   spectrum_  IncrementalPCA with every component, see decomposition.truncate for keeping the first k
+    #   features_  the columns of the scaled table (every column but key, in chunk order)
+
+    def __init__(self, scale_columns, key='CustomerID'):
+        self.scale_columns = list(scale_columns)
+        self.key = key
+
+    def _scaled(self, chunk):
+        scaled = chunk[self.features_].astype(np.float64)
+        scaled[self.scale_columns] = self.scaler_.transform(chunk[self.scale_columns])
+        return scaled
+
+    def fit(self, chunks):
+        self.scaler_ = StandardScaler()
+        self.n_rows_ = 0
+        for chunk in chunks():
+            self.scaler_.partial_fit(chunk[self.scale_columns])
+            self.n_rows_ += len(chunk)
+        if self.n_rows_ == 0:
+            raise ValueError("No customer features to fit on")
+
+        # Every partial_fit needs at least one row per feature, a chunk smaller than that is merged with
+        # the one before it
+        self.spectrum_ = IncrementalPCA()
+        pending = None
+        for chunk in chunks():
+            if pending is None:
+                self.features_ = [column for column in chunk.columns if column != self.key]
+            scaled = self._scaled(chunk)
+            if pending is not None and min(len(pending), len(scaled)) < len(self.features_):
+                pending = pd.concat([pending, scaled])
+                continue
+            if pending is not None:
+                self.spectrum_.partial_fit(pending)
+            pending = scaled
+        self.spectrum_.partial_fit(pending)
+        return self
+
+    # Projects every chunk with pca (by default the whole spectrum_) into a float32 .npy file at file_path,
+    # opened memory-mapped. Returns the array and the keys of its rows.
+    def transform(self, chunks, file_path, pca=None):
+        pca = pca or self.spectrum_
+        directory = os.path.dirname(file_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        projected = np.lib.format.open_memmap(file_path, mode='w+', dtype=np.float32,
+                                              shape=(self.n_rows_, pca.n_components_))
+        keys = []
+        position = 0
+        for chunk in chunks():
+            projected[position:position + len(chunk)] = pca.transform(self._scaled(chunk))
+            keys.append(chunk[self.key].to_numpy())
+            position += len(chunk)
+        if position != self.n_rows_:
+            raise ValueError(f"The chunks gave {position} rows, {self.n_rows_} when fitting")
+        projected.flush()
+        return projected, np.concatenate(keys)
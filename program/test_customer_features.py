@@ -0,0 +1,35 @@
+import numpy as np
+import pandas as pd
+from scipy.stats import linregress
+
+from customer_features import spending_trend
+
+
+# Monthly spend of n_customers random customers, 1 to 24 months each, indexed by (customer, month)
+# like the monthly_spending table of build_customer_features. Every 5th customer spends 1000x more.
+def random_monthly_spending(n_customers=2000, seed=0):
+    rng = np.random.default_rng(seed)
+    months = rng.integers(1, 25, size=n_customers)
+    customers = np.repeat(np.arange(n_customers), months)
+    monthNumbers = np.concatenate([np.sort(rng.choice(36, size=count, replace=False)) for count in months])
+    spend = rng.gamma(2.0, 150.0, size=len(customers)) * np.where(customers % 5 == 0, 1000.0, 1.0)
+    return pd.Series(spend, index=pd.MultiIndex.from_arrays([customers, monthNumbers], names=['customer', 'Month']))
+
+
+def test_spending_trend_matches_linregress():
+    monthlySpending = random_monthly_spending()
+
+    expected = monthlySpending.groupby(level=0).apply(
+        lambda values: linregress(np.arange(len(values)), values.to_numpy())[0] if len(values) > 1 else 0.0)
+
+    trend = spending_trend(monthlySpending)
+    np.testing.assert_allclose(trend.to_numpy(), expected.to_numpy(), rtol=1e-9, atol=1e-9)
+
+
+def test_spending_trend_single_month_is_zero():
+    monthlySpending = pd.Series([10.0, 5.0, 7.0],
+                                index=pd.MultiIndex.from_tuples([(0, 3), (1, 0), (1, 1)], names=['customer', 'Month']))
+
+    trend = spending_trend(monthlySpending)
+    assert trend.loc[0] == 0.0
+    assert np.isclose(trend.loc[1], 2.0)
@@ -0,0 +1,127 @@
+import hashlib
+import json
+import os
+
+import pandas as pd
+
+import cleaning
+import dataset_loader
+from cleaning import clean_transactions
+from dataset_loader import load_dataset
+
+
+# Cache of the cleaned transaction table.
+# The cleaned table is stored as an uncompressed Arrow (Feather) file together with the cleaning report.
+# It is read back memory-mapped and converted without copies where pandas allows it: the numeric and date
+# columns and the codes of the categorical columns stay backed by the file (read-only), the string columns
+# (InvoiceNo, Description, Transaction_Status) are still converted to Python objects.
+# The entry is keyed by the source file's size, modification time and content hash: when the size and
+# mtime are unchanged the entry is used straight away, when only the mtime changed the content hash
+# decides. The entry also records a hash of the code that produced it (the loader, the cleaning rules and
+# the column types), so changing the rules invalidates it.
+
+CACHE_DIR = 'cache'
+TABLE_FILE = 'clean_transactions.arrow'
+REPORT_FILE = 'clean_transactions_report.pkl'
+MANIFEST_FILE = 'clean_transactions.json'
+
+CATEGORICAL_COLUMNS = ['StockCode', 'Country']
+
+
+def content_hash(file_path, block_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as file:
+        for block in iter(lambda: file.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+# Hash of the source of the modules the cached table depends on
+def cleaning_version():
+    digest = hashlib.sha256()
+    for module_file in (dataset_loader.__file__, cleaning.__file__, __file__):
+        with open(module_file, 'rb') as file:
+            digest.update(file.read())
+    return digest.hexdigest()
+
+
+# Compact column types: categorical stock codes / countries and integer customer ids
+# (missing customer ids are already dropped by the cleaning)
+def to_columnar(df):
+    for column in CATEGORICAL_COLUMNS:
+        df[column] = df[column].astype('category')
+    df['CustomerID'] = df['CustomerID'].astype('int32')
+    return df
+
+
+def _read_manifest(cache_dir):
+    manifest_path = os.path.join(cache_dir, MANIFEST_FILE)
+    if not os.path.exists(manifest_path):
+        return None
+    with open(manifest_path, 'r') as file:
+        return json.load(file)
+
+
+def _write_manifest(cache_dir, manifest):
+    with open(os.path.join(cache_dir, MANIFEST_FILE), 'w') as file:
+        json.dump(manifest, file, indent=2)
+
+
+def _is_valid(manifest, file_path, stat, cache_dir):
+    if manifest is None or manifest['source'] != os.path.abspath(file_path):
+        return False
+    if manifest.get('cleaning_version') != cleaning_version():
+        return False
+    if not all(os.path.exists(os.path.join(cache_dir, name)) for name in (TABLE_FILE, REPORT_FILE)):
+        return False
+    if manifest['size'] != stat.st_size:
+        return False
+    if manifest['mtime_ns'] == stat.st_mtime_ns:
+        return True
+
+    # Touched but maybe not changed: compare the contents
+    if manifest['sha256'] != content_hash(file_path):
+        return False
+    manifest['mtime_ns'] = stat.st_mtime_ns
+    _write_manifest(cache_dir, manifest)
+    return True
+
+
+# Cleaned transactions of file_path and the cleaning report, from the cache when the file is unchanged.
+def load_clean_transactions(file_path, cache_dir=CACHE_DIR):
+    try:
+        from pyarrow import feather
+    except ImportError:
+        print("pyarrow is not installed, the cleaned transactions will not be cached.")
+        df, report = clean_transactions(load_dataset(file_path))
+        return to_columnar(df), report
+
+    stat = os.stat(file_path)
+    manifest = _read_manifest(cache_dir)
+
+    if _is_valid(manifest, file_path, stat, cache_dir):
+        print("Loaded the cleaned transactions from the cache.")
+        table = feather.read_table(os.path.join(cache_dir, TABLE_FILE), memory_map=True)
+        df = table.to_pandas(split_blocks=True, self_destruct=True)
+        del table
+        report = pd.read_pickle(os.path.join(cache_dir, REPORT_FILE))
+        return df, report
+
+    df, report = clean_transactions(load_dataset(file_path))
+    df = to_columnar(df)
+
+    os.makedirs(cache_dir, exist_ok=True)
+    if manifest is not None:
+        os.remove(os.path.join(cache_dir, MANIFEST_FILE))
+    feather.write_feather(df, os.path.join(cache_dir, TABLE_FILE), compression='uncompressed')
+    pd.to_pickle(report, os.path.join(cache_dir, REPORT_FILE))
+    # The manifest is written last, so an interrupted write never looks like a valid entry
+    _write_manifest(cache_dir, {
+        'source': os.path.abspath(file_path),
+        'size': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns,
+        'sha256': content_hash(file_path),
+        'cleaning_version': cleaning_version(),
+    })
+
+    return df, report